@@ -0,0 +1,41 @@
+import pandas as pd
+
+
+class RecordAccumulator(object):
+    # buffers rows and frames and builds the table once, instead of
+    # copying the accumulated frame on every DataFrame.append
+
+    def __init__(self, columns, dtypes = None):
+        self.columns = list(columns)
+        self.dtypes = dtypes or {}
+        self._rows = []
+        self._frames = []
+
+    def __len__(self):
+        return(len(self._rows) + sum(len(df) for df in self._frames))
+
+    def append(self, row):
+        self._rows.append(row)
+
+    def extend(self, rows):
+        self._rows.extend(rows)
+
+    def append_frame(self, df):
+        self._flush_rows()
+        self._frames.append(df)
+
+    def _flush_rows(self):
+        if self._rows:
+            self._frames.append(pd.DataFrame(self._rows, columns = self.columns))
+            self._rows = []
+
+    def to_frame(self):
+        self._flush_rows()
+        if self._frames:
+            df = pd.concat(self._frames, ignore_index = True, sort = False)
+            df = df[self.columns]
+        else:
+            df = pd.DataFrame(columns = self.columns)
+        if self.dtypes:
+            df = df.astype(self.dtypes)
+        return(df)
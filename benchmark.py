@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import time
+from unittest import mock
+import synapseutils as su
+import fake_synapse
+import curate_intel
+import curate_shimmer
+import make_dummy_data
+from instrumentation import Instrumentation, peak_rss_mb, count_rows
+
+
+DATASETS = {"intel": curate_intel, "shimmer": curate_shimmer}
+
+
+def time_stage(name, function, *args, files = None, **kwargs):
+    start = time.time()
+    try:
+        result, error = function(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, repr(e)
+    seconds = time.time() - start
+    rows = count_rows(result)
+    record = {"stage": name, "seconds": seconds, "rows": rows,
+              "rows_per_second": rows / seconds if seconds else None,
+              "files": files,
+              "files_per_second": files / seconds if files and seconds else None,
+              "peak_rss_mb": peak_rss_mb(), "error": error}
+    return(result, record)
+
+
+def count_children(syn, parent):
+    if parent is None or parent not in syn.paths:
+        return(None)
+    return(len(list(syn.getChildren(parent))))
+
+
+def run_dataset(name, syn, workers = 1):
+    module = DATASETS[name]
+    stages = []
+    raw_data, record = time_stage("curate_raw_data", module.curate_raw_data, syn,
+                                  workers = workers)
+    record["files"] = len(raw_data) if raw_data is not None else None
+    if record["files"] and record["seconds"]:
+        record["files_per_second"] = record["files"] / record["seconds"]
+    stages.append(record)
+    scores, record = time_stage("curate_scores", module.curate_scores, syn)
+    stages.append(record)
+    metadata, record = time_stage(
+            "curate_metadata", module.curate_metadata, syn,
+            files = count_children(syn, getattr(module, "METADATA_PARENT", None)))
+    stages.append(record)
+    if raw_data is None or scores is None or metadata is None:
+        stages.append({"stage": "store_tables", "error": "skipped, an input stage failed"})
+        return(stages)
+    tables = (raw_data, scores) + tuple(metadata) if name == "intel" \
+            else (raw_data,) + tuple(metadata)
+    stages.append(time_stage("store_tables", module.store_tables, syn, *tables)[1])
+    # storing the same tables again incrementally must not send any rows
+    changes, record = time_stage("restore_tables", module.store_tables, syn, *tables,
+                                 incremental = True)
+    record["changes"] = changes
+    changed = {table: c for table, c in (changes or {}).items() if any(c)}
+    if changed and record["error"] is None:
+        record["error"] = "unchanged tables sent rows (inserts, updates, " \
+                "deletes): {}".format(changed)
+    stages.append(record)
+    return(stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description = "Time the curation stages against a local Synapse stand-in.")
+    parser.add_argument("--data-dir", required = True,
+                        help = "Root of the fake Synapse tree.")
+    parser.add_argument("--subjects", type = int, default = None,
+                        help = "Generate a synthetic tree with this many subjects "
+                               "in --data-dir first if it doesn't exist yet.")
+    parser.add_argument("--days", type = int, default = 1)
+    parser.add_argument("--hours-per-day", type = float, default = 24)
+    parser.add_argument("--datasets", nargs = "+", default = ["intel", "shimmer"],
+                        choices = sorted(DATASETS))
+    parser.add_argument("--workers", type = int, default = 1)
+    parser.add_argument("--output", default = None,
+                        help = "Append results as one JSON line per dataset.")
+    args = parser.parse_args()
+    if args.subjects is not None and not os.path.exists(args.data_dir):
+        make_dummy_data.generate(args.data_dir, args.subjects, args.days,
+                                 args.hours_per_day, args.datasets)
+    with mock.patch.object(su, "walk", fake_synapse.walk), \
+         mock.patch.object(su, "copyFileHandles", fake_synapse.copyFileHandles):
+        for name in args.datasets:
+            syn = fake_synapse.FakeSynapse(args.data_dir)
+            instrumentation = Instrumentation()
+            with instrumentation.patch(syn):
+                stages = run_dataset(name, syn, workers = args.workers)
+            result = {"dataset": name, "started": instrumentation.started,
+                      "data_dir": os.path.abspath(args.data_dir),
+                      "workers": args.workers, "stages": stages,
+                      "operations": instrumentation.stats}
+            print(json.dumps(result))
+            if args.output is not None:
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
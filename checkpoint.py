@@ -0,0 +1,76 @@
+import os
+import pickle
+import threading
+
+
+class Journal(object):
+    # Append-only file of pickled (key, value) records. Each put is flushed
+    # and fsynced before it returns, so after a crash a rerun finds every
+    # record written before it. A record cut short by the crash is dropped
+    # and the file truncated to the last complete one, any other damage is
+    # raised rather than discarding the records after it.
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        with open(self.path, "rb") as f:
+            good = 0
+            while True:
+                try:
+                    key, value = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    if f.read(1): # unreadable record before the end, not a torn write
+                        raise
+                    break
+                self.entries[key] = value
+                good = f.tell()
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def __contains__(self, key):
+        return(key in self.entries)
+
+    def get(self, key, default = None):
+        return(self.entries.get(key, default))
+
+    def put(self, key, value):
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok = True)
+                self._file = open(self.path, "ab")
+            pickle.dump((key, value), self._file)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[key] = value
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def compact(self, keys):
+        # rewrites the journal with only the records for keys
+        self.close()
+        keys = set(keys)
+        self.entries = {k: v for k, v in self.entries.items() if k in keys}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for item in self.entries.items():
+                pickle.dump(item, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.close()
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
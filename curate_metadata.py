@@ -1,13 +1,51 @@
 import synapseclient as sc
 import synapseutils as su
 import pandas as pd
-import dateutil
+import numpy as np
 import copy
+import argparse
+import multiprocessing
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from workbook import Workbook
+from accumulator import RecordAccumulator
+from metadata_time import translate_metadata_time, translate_metadata_times
+from instrumentation import Instrumentation, file_size, report, timed_call
+from scan_manifest import manifest_key
+from checkpoint import Journal
 
 
 PROJECT = "syn17103739"
 METADATA_PARENT = "syn17108135"
+SUBJECT_Q_COLS = ["subject_id", "cohort", "gender", "birth_year",
+    "dominant_hand", "upper_limb_length", "upper_arm_length", "lower_arm_length",
+    "lower_limb_length", "thigh_length", "shank_length", "height", "weight",
+    "visit_date", "diagnosis_day", "diagnosis_month", "diagnosis_year",
+    "pd_most_affected_side", "gait_impediments", "posture_instability",
+    "tremor", "bradykinesia", "disrupted_sleep", "freeze_of_gait", "dyskinesia",
+    "rigidity", "other_symptoms", "last_levodopa_dose_timestamp", "regular_medication",
+    "geneActive_num", "pebble_num", "geneActive_hand", "pebble_hand", "smartphone_location",
+    "recording_start", "recording_end", "timezone", "updrs_time",
+    "updrs_score_p1", "updrs_score_p2", "updrs_score_p3", "updrs_score_p4",
+    "h_and_y_score", "updrs_second_visit_time", "updrs_second_visit_score_p3"]
+CONTROLLED_SESSION_COLS = ["subject_id", "session",
+    "clinical_assessment_timestamp", "medication_intake_timestamp",
+    "medication_name", "medication_dosage", "timezone",
+    "second_medication_intake_timestamp", "stopwatch_start_timestamp",
+    "fox_insight_app_start_timestamp", "geneActiv_start_timestamp",
+    "general_comments"]
+SUBJECT_DIARY_COLS = ["subject_id", "diary", "date", "timezone", "time_lag",
+    "dyskinesia", "tremor", "freeze_of_gait", "slowness_of_movement",
+    "comments"]
+MEDS_COLS = ["subject_id", "timestamp", "pd_related_medications",
+             "other_medications"]
+SLEEP_COLS = ["subject_id", "sleep", "wake"]
+SLEEP_EVENT_COLS = ["subject_id", "diary_num", "order", "kind", "timestamp"]
+FEEDBACK_COLS = ["subject_id", "charge_smartphone", "charge_pebble",
+                 "experience_watches", "experience_devices", "clearness_diary",
+                 "accuracy_diary", "additional_feedback_device_phone",
+                 "additional_feedback_diary", "additional_feedback_experiment"]
 
 
 def translate_metadata_subject_id(file_name):
@@ -16,16 +54,6 @@ def translate_metadata_subject_id(file_name):
     return "{}_{}".format(subject_num, subject_loc)
 
 
-def translate_metadata_time(year, month, day, timestamp):
-    try:
-        dt = dateutil.parser.parse("{}-{}-{} {}".format(year, month, day, timestamp))
-        dt = dt.replace(tzinfo = dateutil.tz.gettz("America/New_York"))
-        timestamp = int(dt.timestamp())
-    except ValueError:
-        timestamp = float("nan")
-    return(timestamp)
-
-
 def iso_format(df):
     if len(str(df.iloc[0])) == 1:
         df.iloc[0] = "0" + str(df.iloc[0])
@@ -37,11 +65,11 @@ def iso_format(df):
         return None
 
 
-def curate_subject_questionnaire(path, subject_id, subject_q_cols,
+def curate_subject_questionnaire(workbook, subject_id, subject_q_cols,
                                  null_str = ["Unknown", "<Select from list>"]):
     record = [subject_id]
-    subject_q = pd.read_excel(
-            path, sheet_name="Subject_Questionnaire", usecols="B", squeeze=True,
+    subject_q = workbook.read_sheet(
+            "Subject_Questionnaire", usecols="B", squeeze=True,
             skiprows=[0,1,2,3,17,21,22,36,37,43,44,53,54,61,62], na_values = null_str)
     visit_date_indices = [12, 13, 14]
     diagnosis_date_indices = [15, 16, 17]
@@ -51,62 +79,71 @@ def curate_subject_questionnaire(path, subject_id, subject_q_cols,
         if index == visit_date_indices[0]:
             record.append(iso_format(subject_q.iloc[visit_date_indices]))
         elif index == last_levodopa_dose_date_indices[0]:
-            last_time = subject_q.iloc[last_levodopa_dose_date_indices]
-            record.append(translate_metadata_time(*last_time.iloc[::-1]))
+            record.append(None) # filled in below, once the timezone is known
         elif index not in (visit_date_indices + last_levodopa_dose_date_indices):
             record.append(value)
+    last_time = subject_q.iloc[last_levodopa_dose_date_indices]
+    record[subject_q_cols.index("last_levodopa_dose_timestamp")] = \
+            translate_metadata_time(*last_time.iloc[::-1],
+                                    timezone = record[subject_q_cols.index("timezone")])
     subject_q_row = pd.DataFrame([record], columns = subject_q_cols)
     return(subject_q_row)
 
 
+def subject_timezone(workbook, subject_id):
+    # the timezone the subject's diary times were recorded in
+    subject_q = curate_subject_questionnaire(workbook, subject_id, SUBJECT_Q_COLS)
+    return(subject_q["timezone"].iloc[0])
+
+
 def parse_controlled_sessions_values(controlled_session, subject_id, session_num):
     record = [subject_id, session_num]
     clinical_assessment_date_indices = [0, 1, 2]
     time_indices = [3, 4, 8, 9, 10, 11]
-    clinical_assessment_date_vals = None
+    timezone_index = 7
+    day, month, year = controlled_session.iloc[clinical_assessment_date_indices]
+    timestamps = translate_metadata_times(
+            [year] * len(time_indices), [month] * len(time_indices),
+            [day] * len(time_indices), controlled_session.iloc[time_indices].values,
+            timezone = controlled_session.iloc[timezone_index])
+    timestamps = dict(zip(time_indices, timestamps))
     for item in controlled_session.iteritems():
         index, value = item
         if index in clinical_assessment_date_indices:
-            if clinical_assessment_date_vals is None:
-                clinical_assessment_date_vals = controlled_session.iloc[
-                        clinical_assessment_date_indices]
-            else:
-                pass
+            pass
         elif index in time_indices:
-            record.append(translate_metadata_time(
-                *clinical_assessment_date_vals[::-1],
-                value))
+            record.append(timestamps[index])
         else:
             record.append(value)
     return record
 
 
-def curate_controlled_sessions(path, subject_id, controlled_session_cols,
+def curate_controlled_sessions(workbook, subject_id, controlled_session_cols,
                                null_str = ["Unknown", "<Select from list>"]):
-    first_session_t1 = pd.read_excel(path, sheet_name = "1st Controlled_Session",
-                                     skiprows=3, usecols="C", skipfooter=1,
-                                     squeeze = True, na_values = null_str)
-    second_session_t1 = pd.read_excel(path, sheet_name = "2nd Controlled_Session",
-                                      skiprows=3, usecols="C", skipfooter=1,
-                                      squeeze = True, na_values = null_str)
-    first_session_second_meds = pd.read_excel(
-            path, sheet_name = "1st Controlled_Session", skiprows=8, usecols="D",
+    first_session_t1 = workbook.read_sheet("1st Controlled_Session",
+                                           skiprows=3, usecols="C", skipfooter=1,
+                                           squeeze = True, na_values = null_str)
+    second_session_t1 = workbook.read_sheet("2nd Controlled_Session",
+                                            skiprows=3, usecols="C", skipfooter=1,
+                                            squeeze = True, na_values = null_str)
+    first_session_second_meds = workbook.read_sheet(
+            "1st Controlled_Session", skiprows=8, usecols="D",
             skipfooter=3, squeeze = True, na_values = null_str, header = None)
-    second_session_second_meds = pd.read_excel(
-            path, sheet_name = "2nd Controlled_Session", skiprows=8, usecols="D",
+    second_session_second_meds = workbook.read_sheet(
+            "2nd Controlled_Session", skiprows=8, usecols="D",
             skipfooter=3, squeeze = True, na_values = null_str, header = None)
-    first_session_t2 = pd.read_excel(path, sheet_name = "1st Controlled_Session",
-                                     skiprows=4, skipfooter = 5, usecols="H",
-                                     squeeze = True, na_values = null_str)
-    second_session_t2 = pd.read_excel(path, sheet_name = "2nd Controlled_Session",
-                                     skiprows=4, skipfooter = 5, usecols="H",
-                                     squeeze = True, na_values = null_str)
-    first_session_comments = pd.read_excel(path, sheet_name = "1st Controlled_Session",
-                                           skiprows=4, usecols="M", skipfooter=7,
-                                           squeeze = True)
-    second_session_comments = pd.read_excel(path, sheet_name = "2nd Controlled_Session",
-                                            skiprows=4, usecols="M", skipfooter=7,
-                                            squeeze = True)
+    first_session_t2 = workbook.read_sheet("1st Controlled_Session",
+                                           skiprows=4, skipfooter = 5, usecols="H",
+                                           squeeze = True, na_values = null_str)
+    second_session_t2 = workbook.read_sheet("2nd Controlled_Session",
+                                            skiprows=4, skipfooter = 5, usecols="H",
+                                            squeeze = True, na_values = null_str)
+    first_session_comments = workbook.read_sheet("1st Controlled_Session",
+                                                 skiprows=4, usecols="M", skipfooter=7,
+                                                 squeeze = True)
+    second_session_comments = workbook.read_sheet("2nd Controlled_Session",
+                                                  skiprows=4, usecols="M", skipfooter=7,
+                                                  squeeze = True)
     first_session = pd.concat([first_session_t1, first_session_second_meds[:1],
                                first_session_t2, first_session_comments],
                               ignore_index=True)
@@ -141,19 +178,19 @@ def parse_subject_diary(r):
     return results
 
 
-def curate_subject_diary(path, subject_id, subject_diary_cols):
+def curate_subject_diary(workbook, subject_id, subject_diary_cols):
     record_one = []
     record_two = []
-    first_diary_date = pd.read_excel(path, sheet_name="1st In Clinic Subject Diary",
-                                     skiprows=4, usecols="C", squeeze=True,
-                                     header=None).iloc[:4]
-    second_diary_date = pd.read_excel(path, sheet_name="2nd In Clinic Subject Diary",
-                                     skiprows=4, usecols="C", squeeze=True,
-                                     header=None).iloc[:4]
-    first_diary = pd.read_excel(path, sheet_name="1st In Clinic Subject Diary",
-                                skiprows=12, usecols="B:I", header=None)
-    second_diary = pd.read_excel(path, sheet_name = "2nd In Clinic Subject Diary",
-                                 skiprows=12, usecols="B:I", header=None)
+    first_diary_date = workbook.read_sheet("1st In Clinic Subject Diary",
+                                           skiprows=4, usecols="C", squeeze=True,
+                                           header=None).iloc[:4]
+    second_diary_date = workbook.read_sheet("2nd In Clinic Subject Diary",
+                                            skiprows=4, usecols="C", squeeze=True,
+                                            header=None).iloc[:4]
+    first_diary = workbook.read_sheet("1st In Clinic Subject Diary",
+                                      skiprows=12, usecols="B:I", header=None)
+    second_diary = workbook.read_sheet("2nd In Clinic Subject Diary",
+                                       skiprows=12, usecols="B:I", header=None)
     first_date = iso_format(first_diary_date.iloc[:3])
     second_date = iso_format(second_diary_date.iloc[:3])
     first_tz = first_diary_date.iloc[3]
@@ -173,141 +210,217 @@ def curate_subject_diary(path, subject_id, subject_diary_cols):
     subject_diary_curated = pd.concat([record_one_df, record_two_df], ignore_index=True)
     return(subject_diary_curated)
 
-def curate_metadata(syn):
+def curate_meds(meds, subject_id, meds_cols, timezone = None):
+    meds = meds[["Day (DD)", "Month (MM)", "Year (YYYY)", "Time (hh:mm - 24 hour format)",
+                 "PD-related medications taken", "Other medications taken"]]
+    meds.columns = ["day", "month", "year", "time",
+                    "pd_related_medications", "other_medications"]
+    is_valid = (meds["day"].notnull() & meds["month"].notnull() &
+                meds["year"].notnull() &
+                meds["time"].astype(str).str.match("\d\d:\d\d:\d\d"))
+    meds = meds[is_valid]
+    timestamps = translate_metadata_times(
+            meds["year"], meds["month"], meds["day"], meds["time"],
+            timezone = timezone)
+    meds_curated = pd.DataFrame({
+        "subject_id": subject_id,
+        "timestamp": timestamps,
+        "pd_related_medications": meds["pd_related_medications"].values,
+        "other_medications": meds["other_medications"].values},
+        columns = meds_cols)
+    return(meds_curated)
+
+
+def extract_sleep_events(sleep, subject_id, diary_num, timezone = None,
+                         null_str = "<Select from list>"):
+    # one event per recorded sleep or wake time and one "end" event per
+    # end-of-data marker row, ordered as they appear in the diary
+    sleep = sleep[["Day (DD)", "Month (MM)", "Year (YYYY)",
+                   "Time fallen asleep (hh:mm - 24 hour format)",
+                   "Time woke up (hh:mm - 24 hour format)"]]
+    sleep.columns = ["day", "month", "year", "sleep", "wake"]
+    sleep = sleep.reset_index(drop = True)
+    has_date = (sleep["day"].notnull() & sleep["month"].notnull() &
+                sleep["year"].notnull())
+    is_end = (sleep["day"] == null_str) & (sleep["month"] == null_str)
+    position = sleep.index.values * 3
+    events = [pd.DataFrame({"order": position[is_end.values], "kind": "end",
+                            "timestamp": np.nan})]
+    for offset, kind in [(1, "sleep"), (2, "wake")]:
+        has_event = has_date & sleep[kind].astype(str).str.match("\d\d:\d\d:\d\d")
+        rows = sleep[has_event]
+        events.append(pd.DataFrame({
+            "order": position[has_event.values] + offset,
+            "kind": kind,
+            "timestamp": translate_metadata_times(
+                rows["year"], rows["month"], rows["day"], rows[kind],
+                timezone = timezone)}))
+    events = pd.concat(events, ignore_index = True, sort = False)
+    events = events.sort_values("order")
+    events.insert(0, "diary_num", diary_num)
+    events.insert(0, "subject_id", subject_id)
+    return(events[SLEEP_EVENT_COLS])
+
+
+def pair_sleep_events(events, sleep_cols):
+    # A sleep is paired with the wake that directly follows it. A sleep
+    # followed by another sleep gets no wake, and a wake with no sleep before
+    # it gets no sleep. The first end marker reached while a sleep is open
+    # closes that sleep and ends the diary; a sleep still open when the diary
+    # runs out without a marker is dropped.
+    if len(events) == 0:
+        return(pd.DataFrame(columns = sleep_cols))
+    events = events.reset_index(drop = True)
+    diary = events["diary_num"]
+    is_end = events["kind"] == "end"
+    last_kind = events["kind"].where(~is_end).groupby(diary).shift(1)
+    last_kind = last_kind.groupby(diary).ffill()
+    is_break = is_end & (last_kind == "sleep")
+    after_break = is_break.astype(int).groupby(diary).cumsum() > 0
+    ended = is_break.groupby(diary).transform("any").astype(bool)
+    events = events[~after_break & ~is_end]
+    ended = ended[events.index]
+    diary = events["diary_num"]
+    next_kind = events["kind"].groupby(diary).shift(-1)
+    next_timestamp = events["timestamp"].groupby(diary).shift(-1)
+    last_kind = events["kind"].groupby(diary).shift(1)
+    is_sleep = events["kind"] == "sleep"
+    is_wake = events["kind"] == "wake"
+    is_record = (is_sleep & (next_kind.notnull() | ended) |
+                 is_wake & (last_kind != "sleep"))
+    sleep_curated = pd.DataFrame({
+        "subject_id": events["subject_id"],
+        "sleep": events["timestamp"].where(is_sleep),
+        "wake": next_timestamp.where(next_kind == "wake").where(
+            is_sleep, events["timestamp"])}, columns = sleep_cols)
+    return(sleep_curated[is_record].reset_index(drop = True))
+
+
+def curate_feedback(feedback, subject_id, null_str = "<Select from list>"):
+    feedback.columns = ["question", "answer"]
+    feedback = feedback[feedback["question"].notnull()]
+    question_num = feedback["question"].astype(str).str[0]
+    is_scored = question_num.isin(list("123456"))
+    is_free_text = question_num.isin(list("789"))
+    is_text = feedback["answer"].map(lambda a: isinstance(a, str))
+    scores = feedback["answer"].where(
+            is_text & (feedback["answer"] != null_str)).astype(object).str.extract(
+                    "(\d+)", expand = False)
+    has_score = is_scored & scores.notnull()
+    has_text = is_free_text & ~feedback["answer"].isin(["--", null_str])
+    texts = feedback["answer"].where(has_text, "")
+    # built as a list, so scores stay ints rather than being upcast to floats
+    answers = [int(score) if scored else text for score, scored, text, keep in zip(
+        scores, has_score, texts, is_scored | is_free_text) if keep]
+    return([subject_id] + answers)
+
+
+def curate_workbook(path, subject_id, diary_num):
+    # everything curated from one subject's workbook, as one frame per table
+    with Workbook(path) as workbook:
+        meds = workbook.read_sheet("Home Diary - Meds", skiprows=3)
+        sleep = workbook.read_sheet("Home Diary - Sleep", skiprows=3)
+        feedback = workbook.read_sheet("Feedback_Questionnaire",
+                                       skiprows=2, usecols = "A:B")
+        subject_q = curate_subject_questionnaire(workbook, subject_id, SUBJECT_Q_COLS)
+        controlled_sessions = curate_controlled_sessions(
+                workbook, subject_id, CONTROLLED_SESSION_COLS)
+        subject_diary = curate_subject_diary(workbook, subject_id, SUBJECT_DIARY_COLS)
+    timezone = subject_q["timezone"].iloc[0]
+    meds = curate_meds(meds, subject_id, MEDS_COLS, timezone = timezone)
+    sleep_events = extract_sleep_events(sleep, subject_id, diary_num,
+                                        timezone = timezone)
+    feedback = pd.DataFrame([curate_feedback(feedback, subject_id)],
+                            columns = FEEDBACK_COLS)
+    return(subject_q, controlled_sessions, subject_diary, meds, sleep_events, feedback)
+
+
+def curate_metadata(syn, workers = 1, journal_path = None):
+    # with a journal_path each workbook's curated frames are journaled as
+    # soon as they are ready, and workbooks whose current version is already
+    # in the journal are not downloaded or parsed again
     w = su.walk(syn, METADATA_PARENT)
     _, _, metadata_files = next(w)
-    subject_q_cols = ["subject_id", "cohort", "gender", "birth_year",
-        "dominant_hand", "upper_limb_length", "upper_arm_length", "lower_arm_length",
-        "lower_limb_length", "thigh_length", "shank_length", "height", "weight",
-        "visit_date", "diagnosis_day", "diagnosis_month", "diagnosis_year",
-        "pd_most_affected_side", "gait_impediments", "posture_instability",
-        "tremor", "bradykinesia", "disrupted_sleep", "freeze_of_gait", "dyskinesia",
-        "rigidity", "other_symptoms", "last_levodopa_dose_timestamp", "regular_medication",
-        "geneActive_num", "pebble_num", "geneActive_hand", "pebble_hand", "smartphone_location",
-        "recording_start", "recording_end", "timezone", "updrs_time",
-        "updrs_score_p1", "updrs_score_p2", "updrs_score_p3", "updrs_score_p4",
-        "h_and_y_score", "updrs_second_visit_time", "updrs_second_visit_score_p3"]
-    subject_q_curated = pd.DataFrame(columns = subject_q_cols)
-    controlled_session_cols = ["subject_id", "session",
-        "clinical_assessment_timestamp", "medication_intake_timestamp",
-        "medication_name", "medication_dosage", "timezone",
-        "second_medication_intake_timestamp", "stopwatch_start_timestamp",
-        "fox_insight_app_start_timestamp", "geneActiv_start_timestamp",
-        "general_comments"]
-    controlled_session_curated = pd.DataFrame(columns = controlled_session_cols)
-    subject_diary_cols = ["subject_id", "diary", "date", "timezone", "time_lag",
-        "dyskinesia", "tremor", "freeze_of_gait", "slowness_of_movement",
-        "comments"]
-    subject_diary_curated = pd.DataFrame(columns = subject_diary_cols)
-    meds_cols = ["subject_id", "timestamp", "pd_related_medications",
-                 "other_medications"]
-    meds_curated = pd.DataFrame(columns = meds_cols)
-    sleep_cols = ["subject_id", "sleep", "wake"]
-    sleep_curated = pd.DataFrame(columns = sleep_cols)
-    feedback_cols = ["subject_id", "charge_smartphone", "charge_pebble",
-                     "experience_watches", "experience_devices", "clearness_diary",
-                     "accuracy_diary", "additional_feedback_device_phone",
-                     "additional_feedback_diary", "additional_feedback_experiment"]
-    feedback_curated = pd.DataFrame(columns = feedback_cols)
-    null_str = "<Select from list>"
-    for metadata_name, metadata_id in metadata_files:
-        subject_id = translate_metadata_subject_id(metadata_name)
-        f = syn.get(metadata_id)
-        meds = pd.read_excel(
-                f.path, sheet_name = "Home Diary - Meds", skiprows=3)
-        sleep = pd.read_excel(
-                f.path, sheet_name = "Home Diary - Sleep", skiprows=3)
-        feedback = pd.read_excel(f.path, sheet_name = "Feedback_Questionnaire",
-                                 skiprows=2, usecols = "A:B")
-        subject_q_curated = subject_q_curated.append(
-                curate_subject_questionnaire(f.path, subject_id, subject_q_cols),
-                ignore_index=True)
-        controlled_session_curated = controlled_session_curated.append(
-                curate_controlled_sessions(f.path, subject_id, controlled_session_cols),
-                ignore_index=True)
-        subject_diary_curated = subject_diary_curated.append(
-                curate_subject_diary(f.path, subject_id, subject_diary_cols),
-                ignore_index=True)
-        # meds
-        meds = meds[["Day (DD)", "Month (MM)", "Year (YYYY)", "Time (hh:mm - 24 hour format)",
-                     "PD-related medications taken", "Other medications taken"]]
-        meds.columns = ["day", "month", "year", "time",
-                        "pd_related_medications", "other_medications"]
-        meds_curated_records = []
-        for i, r in meds.iterrows():
-            if (pd.notnull(r['day']) and pd.notnull(r['month']) and
-                pd.notnull(r['year']) and re.match("\d\d:\d\d:\d\d", str(r['time']))):
-                timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['time'])
-                meds_curated_records.append([subject_id, timestamp, r['pd_related_medications'],
-                                             r['other_medications']])
-        meds_curated_records = pd.DataFrame(meds_curated_records, columns = meds_cols)
-        meds_curated = meds_curated.append(meds_curated_records, ignore_index = True)
-        # sleep
-        sleep = sleep[["Day (DD)", "Month (MM)", "Year (YYYY)",
-                       "Time fallen asleep (hh:mm - 24 hour format)",
-                       "Time woke up (hh:mm - 24 hour format)"]]
-        sleep.columns = ["day", "month", "year", "sleep", "wake"]
-        sleep_curated_records = []
-        sleep_curated_row = [subject_id]
-        for i, r in sleep.iterrows():
-            if r['day'] == null_str and r['month'] == null_str: # end of metadata
-                if len(sleep_curated_row) == 2: # wake recorded but no sleep
-                    sleep_curated_row.append(None)
-                    sleep_curated_records.append(sleep_curated_row)
-                    break
-            if (pd.notnull(r['day']) and pd.notnull(r['month']) and
-               pd.notnull(r['year'])):
-                if re.match("\d\d:\d\d:\d\d", str(r['sleep'])):
-                    timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['sleep'])
-                    if len(sleep_curated_row) == 1: # only contains subject_id
-                        sleep_curated_row.append(timestamp)
-                    else: # last record was a sleep record
-                        sleep_curated_row.append(None) # no wake recorded for this record
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id, timestamp]
-                if re.match("\d\d:\d\d:\d\d", str(r['wake'])):
-                    timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['wake'])
-                    if len(sleep_curated_row) == 2: # contains both subject_id and sleep
-                        sleep_curated_row.append(timestamp)
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id]
-                    else: # no previous sleep timestamp recorded
-                        sleep_curated_row.append(None)
-                        sleep_curated_row.append(timestamp)
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id]
-        sleep_curated_records = pd.DataFrame(sleep_curated_records, columns = sleep_cols)
-        sleep_curated = sleep_curated.append(sleep_curated_records, ignore_index = True)
-        # feedback
-        feedback.columns = ["question", "answer"]
-        feedback_curated_records = []
-        feedback_curated_row = [subject_id]
-        for i, r in feedback.iterrows():
-            if pd.notnull(r["question"]):
-                if r["question"][0] in list(map(str, range(1, 7))):
-                    if isinstance(r["answer"], str) and r["answer"] != null_str:
-                        answer = int(re.search("\d+", r["answer"]).group())
-                    else:
-                        answer = ""
-                    feedback_curated_row.append(answer)
-                elif r["question"][0].isdigit() and int(r["question"][0]) > 6:
-                    if r["answer"] == "--" or r["answer"] == null_str:
-                        answer = ""
-                    else:
-                        answer = r["answer"]
-                    feedback_curated_row.append(answer)
-        feedback_curated_records = pd.DataFrame([feedback_curated_row],
-                                                columns = feedback_cols)
-        feedback_curated = feedback_curated.append(feedback_curated_records)
-    return subject_q_curated, controlled_session_curated, subject_diary_curated, meds_curated, sleep_curated, feedback_curated
+    curated = [RecordAccumulator(SUBJECT_Q_COLS),
+               RecordAccumulator(CONTROLLED_SESSION_COLS),
+               RecordAccumulator(SUBJECT_DIARY_COLS),
+               RecordAccumulator(MEDS_COLS, dtypes = {"timestamp": "float64"}),
+               RecordAccumulator(SLEEP_EVENT_COLS),
+               RecordAccumulator(FEEDBACK_COLS)]
+    journal = Journal(journal_path) if journal_path else None
+    # forkserver workers don't inherit the synapseclient session and its threads
+    pool = ProcessPoolExecutor(
+            max_workers = workers, mp_context = multiprocessing.get_context(
+                "forkserver")) if workers > 1 else None
+    try:
+        keys = []
+        results = {}
+        pending = {}
+        for diary_num, (metadata_name, metadata_id) in enumerate(metadata_files):
+            key = str(diary_num)
+            if journal is not None:
+                key = "{}.{}".format(
+                    manifest_key(syn.get(metadata_id, downloadFile = False)), diary_num)
+            keys.append(key)
+            if journal is not None and key in journal:
+                results[key] = journal.get(key)
+                continue
+            subject_id = translate_metadata_subject_id(metadata_name)
+            f = syn.get(metadata_id)
+            if pool is not None:
+                pending[pool.submit(timed_call, curate_workbook, f.path, subject_id,
+                                    diary_num)] = (key, f.path)
+            else:
+                results[key], seconds, peak = timed_call(
+                        curate_workbook, f.path, subject_id, diary_num)
+                report("parse_workbook", seconds, file_size(f.path), peak = peak)
+                if journal is not None:
+                    journal.put(key, results[key])
+        for future in as_completed(pending):
+            key, path = pending[future]
+            results[key], seconds, peak = future.result()
+            report("parse_workbook", seconds, file_size(path), peak = peak)
+            if journal is not None:
+                journal.put(key, results[key])
+        for key in keys:
+            for accumulator, frame in zip(curated, results[key]):
+                accumulator.append_frame(frame)
+        if journal is not None:
+            journal.compact(keys)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if journal is not None:
+            journal.close()
+    (subject_q_curated, controlled_session_curated, subject_diary_curated,
+     meds_curated, sleep_events, feedback_curated) = [c.to_frame() for c in curated]
+    sleep_curated = pair_sleep_events(sleep_events, SLEEP_COLS)
+    return (subject_q_curated, controlled_session_curated, subject_diary_curated,
+            meds_curated, sleep_curated, feedback_curated)
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "Number of processes used to parse workbooks.")
+    parser.add_argument("--report", default = None,
+                        help = "Where to write the JSON timing report.")
+    parser.add_argument("--no-instrumentation", action = "store_true")
+    parser.add_argument("--cache-dir", default = ".curation_cache",
+                        help = "Directory for the workbook journal.")
+    args = parser.parse_args()
     syn = sc.login()
-    curate_metadata(syn)
+    journal_path = os.path.join(
+            args.cache_dir, "{}_workbook_journal.pkl".format(PROJECT))
+    if args.no_instrumentation:
+        curate_metadata(syn, workers = args.workers, journal_path = journal_path)
+        return
+    instrumentation = Instrumentation()
+    try:
+        with instrumentation.patch(syn), instrumentation.measure("stage.metadata"):
+            curate_metadata(syn, workers = args.workers, journal_path = journal_path)
+    finally:
+        instrumentation.write(args.report or "{}_metadata_report.json".format(PROJECT))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,26 @@
 import synapseclient as sc
 import synapseutils as su
 import pandas as pd
-import dateutil
-import copy
+import numpy as np
+import argparse
+import functools
+import os
 import re
+from workbook import Workbook
+from curate_metadata import (curate_meds, curate_feedback, extract_sleep_events,
+                             pair_sleep_events, subject_timezone, SLEEP_EVENT_COLS)
+from accumulator import RecordAccumulator
+from sensor_files import (scan_sensor_files, summary_columns, is_summary_column,
+                          PREFETCH)
+from scan_manifest import ScanManifest, manifest_key
+from checkpoint import Journal
+from download_cache import DownloadCache
+from pipeline import Pipeline
+from file_handle_copy import FileHandleCopier
+from instrumentation import Instrumentation
+from table_upload import TableUploader
+from table_serialization import serialize_columns
+from table_diff import store_incremental
 
 
 PROJECT = "syn18080900"
@@ -14,9 +31,18 @@ SHIMMER_RIGHT_ANKLE = "syn18080904"
 SHIMMER_RIGHT_WRIST = "syn18080905"
 TASKS_AND_SCORES_CLINIC = "syn18081471"
 TASKS_AND_SCORES_HOME = "syn18081561"
+# the subjects' workbooks cover both device sets and live in the Intel project
+METADATA_PARENT = "syn17108135"
+NATURAL_KEYS = {
+        "Sensor Measurements": ["subject_id", "source_file"],
+        "Medication Diary": ["subject_id", "timestamp"],
+        "Sleep Diary": ["subject_id", "sleep"],
+        "Feedback Survey": ["subject_id"]}
 
 
-def curate_raw_data(syn):
+def curate_raw_data(syn, timestamps_sorted = False, workers = 1,
+                    manifest_path = None, copy_mapping_path = None, summarize = True,
+                    prefetch = PREFETCH, download_cache = None):
     raw_data_folders = [SHIMMER_BACK, SHIMMER_LEFT_ANKLE, SHIMMER_LEFT_WRIST,
                         SHIMMER_RIGHT_ANKLE, SHIMMER_RIGHT_WRIST]
     raw_data_locations = ["Back", "LeftAnkle", "LeftWrist",
@@ -24,11 +50,10 @@ def curate_raw_data(syn):
     data_cols = ["subject_id", "device", "device_position", "participant_day",
                  "timestamp_start", "timestamp_end", "source_file",
                  "data_file_handle_id"]
-    raw_data = pd.DataFrame(columns = data_cols)
+    records = []
     for folder, device_location in zip(raw_data_folders, raw_data_locations):
         w = su.walk(syn, folder)
         parent, folders, _ = next(w)
-        records = []
         for folder_name, folder_id in folders:
             subject, _, subject_files = next(w)
             subject_num = int(re.search("\d+", folder_name).group())
@@ -36,34 +61,30 @@ def curate_raw_data(syn):
             subject_id = "{}_{}".format(subject_num, subject_loc)
             for file_name, file_id in subject_files:
                 file_day = int(re.search("\d+", file_name).group())
-                syn_file = syn.get(file_id)
-                df = pd.read_table(syn_file.path)
-                timestamp_start = min(df.timestamp)
-                timestamp_end = max(df.timestamp)
-                fhid = syn_file['dataFileHandleId']
                 records.append([subject_id, "Shimmer", device_location, file_day,
-                                timestamp_start, timestamp_end, file_id, fhid])
-        raw_data_table = pd.DataFrame(records, columns = data_cols)
-        fhids_to_copy = raw_data_table['data_file_handle_id'].tolist()
-        source_files = raw_data_table["source_file"].tolist()
-        new_fhids = []
-        for i in range(0, len(fhids_to_copy), 100):
-            fhids_subset = fhids_to_copy[i:i+100]
-            source_files_subset = source_files[i:i+100]
-            new_fhids_subset = su.copyFileHandles(
-                    syn = syn,
-                    fileHandles = fhids_subset,
-                    associateObjectTypes = ["FileEntity"] * len(fhids_subset),
-                    associateObjectIds = source_files_subset,
-                    contentTypes = ["text/tab-separated-values"] * len(fhids_subset),
-                    fileNames = [None] * len(fhids_subset))
-            new_fhids_subset = [int(i['newFileHandle']['id'])
-                                for i in new_fhids_subset['copyResults']]
-            new_fhids = new_fhids + new_fhids_subset
-        fhid_mapping = {k: v for k, v in zip(fhids_to_copy, new_fhids)}
-        raw_data_table["data_file_handle_id"] = \
-                raw_data_table["data_file_handle_id"].map(fhid_mapping)
-        raw_data = raw_data.append(raw_data_table, ignore_index = True, sort = False)
+                                file_id])
+    manifest = ScanManifest(manifest_path) if manifest_path else None
+    files = [(r[-1], r[-2]) for r in records]
+    scans = scan_sensor_files(syn, files, workers = workers,
+                              timestamps_sorted = timestamps_sorted,
+                              manifest = manifest, summarize = summarize,
+                              prefetch = prefetch, download_cache = download_cache)
+    summary_cols = summary_columns(scans) if summarize else []
+    records = [r[:-1] + [scan["timestamp_start"], scan["timestamp_end"], r[-1],
+                         scan["dataFileHandleId"]] + [scan.get(c, np.nan) for c in summary_cols]
+               for r, scan in zip(records, scans)]
+    dtypes = {"participant_day": "int64", "timestamp_start": "float64",
+              "timestamp_end": "float64"}
+    dtypes.update({c: "int64" if c.endswith("_count") else "float64"
+                   for c in summary_cols})
+    raw_data = RecordAccumulator(data_cols + summary_cols, dtypes = dtypes)
+    raw_data.extend(records)
+    raw_data = raw_data.to_frame()
+    copier = FileHandleCopier(syn, mapping_path = copy_mapping_path)
+    fhid_mapping = copier.copy(raw_data["data_file_handle_id"].tolist(),
+                               raw_data["source_file"].tolist())
+    raw_data["data_file_handle_id"] = \
+            raw_data["data_file_handle_id"].map(fhid_mapping)
     return(raw_data)
 
 
@@ -118,131 +139,59 @@ def translate_metadata_subject_id(file_name):
     return "{}_{}".format(subject_num, subject_loc)
 
 
-def translate_metadata_time(year, month, day, timestamp):
-    dt = dateutil.parser.parse("{}-{}-{} {}".format(year, month, day, timestamp))
-    dt = dt.replace(tzinfo = dateutil.tz.gettz("America/New_York"))
-    timestamp = int(dt.timestamp())
-    return(timestamp)
-
-
-def curate_metadata(syn):
+def curate_metadata(syn, journal_path = None):
+    # with a journal_path each workbook's records are journaled once curated
+    # and workbook versions already in the journal are skipped
     w = su.walk(syn, METADATA_PARENT)
     _, _, metadata_files = next(w)
     meds_cols = ["subject_id", "timestamp", "pd_related_medications",
                  "other_medications"]
-    meds_curated = pd.DataFrame(columns = meds_cols)
+    meds_curated = RecordAccumulator(meds_cols, dtypes = {"timestamp": "float64"})
     sleep_cols = ["subject_id", "sleep", "wake"]
-    sleep_curated = pd.DataFrame(columns = sleep_cols)
+    sleep_events = RecordAccumulator(SLEEP_EVENT_COLS)
     feedback_cols = ["subject_id", "charge_smartphone", "charge_pebble",
                      "experience_watches", "experience_devices", "clearness_diary",
                      "accuracy_diary", "additional_feedback_device_phone",
                      "additional_feedback_diary", "additional_feedback_experiment"]
-    feedback_curated = pd.DataFrame(columns = feedback_cols)
-    null_str = "<Select from list>"
-    for metadata_name, metadata_id in metadata_files:
+    feedback_curated = RecordAccumulator(feedback_cols)
+    journal = Journal(journal_path) if journal_path else None
+    keys = []
+    for diary_num, (metadata_name, metadata_id) in enumerate(metadata_files):
         subject_id = translate_metadata_subject_id(metadata_name)
-        f = syn.get(metadata_id)
-        meds = pd.read_excel(
-                f.path, sheet_name = "Home Diary - Meds", skiprows=3)
-        sleep = pd.read_excel(
-                f.path, sheet_name = "Home Diary - Sleep", skiprows=3)
-        feedback = pd.read_excel(f.path, sheet_name = "Feedback_Questionnaire",
-                                 skiprows=2, usecols = "A:B")
-        # meds
-        meds = meds[["Day (DD)", "Month (MM)", "Year (YYYY)", "Time (hh:mm - 24 hour format)",
-                     "PD-related medications taken", "Other medications taken"]]
-        meds.columns = ["day", "month", "year", "time",
-                        "pd_related_medications", "other_medications"]
-        meds_curated_records = []
-        for i, r in meds.iterrows():
-            if (pd.notnull(r['day']) and pd.notnull(r['month']) and
-                pd.notnull(r['year']) and re.match("\d\d:\d\d:\d\d", str(r['time']))):
-                timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['time'])
-                meds_curated_records.append([subject_id, timestamp, r['pd_related_medications'],
-                                             r['other_medications']])
-        meds_curated_records = pd.DataFrame(meds_curated_records, columns = meds_cols)
-        meds_curated = meds_curated.append(meds_curated_records, ignore_index = True)
-        # sleep
-        sleep = sleep[["Day (DD)", "Month (MM)", "Year (YYYY)",
-                       "Time fallen asleep (hh:mm - 24 hour format)",
-                       "Time woke up (hh:mm - 24 hour format)"]]
-        sleep.columns = ["day", "month", "year", "sleep", "wake"]
-        sleep_curated_records = []
-        sleep_curated_row = [subject_id]
-        for i, r in sleep.iterrows():
-            if r['day'] == null_str and r['month'] == null_str: # end of metadata
-                if len(sleep_curated_row) == 2: # wake recorded but no sleep
-                    sleep_curated_row.append(None)
-                    sleep_curated_records.append(sleep_curated_row)
-                    break
-            if (pd.notnull(r['day']) and pd.notnull(r['month']) and
-               pd.notnull(r['year'])):
-                if re.match("\d\d:\d\d:\d\d", str(r['sleep'])):
-                    timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['sleep'])
-                    if len(sleep_curated_row) == 1: # only contains subject_id
-                        sleep_curated_row.append(timestamp)
-                    else: # last record was a sleep record
-                        sleep_curated_row.append(None) # no wake recorded for this record
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id, timestamp]
-                if re.match("\d\d:\d\d:\d\d", str(r['wake'])):
-                    timestamp = translate_metadata_time(
-                        int(r['year']), r['month'], r['day'], r['wake'])
-                    if len(sleep_curated_row) == 2: # contains both subject_id and sleep
-                        sleep_curated_row.append(timestamp)
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id]
-                    else: # no previous sleep timestamp recorded
-                        sleep_curated_row.append(None)
-                        sleep_curated_row.append(timestamp)
-                        sleep_curated_records.append(sleep_curated_row)
-                        sleep_curated_row = [subject_id]
-        sleep_curated_records = pd.DataFrame(sleep_curated_records, columns = sleep_cols)
-        sleep_curated = sleep_curated.append(sleep_curated_records, ignore_index = True)
-        # feedback
-        feedback.columns = ["question", "answer"]
-        feedback_curated_records = []
-        feedback_curated_row = [subject_id]
-        for i, r in feedback.iterrows():
-            if pd.notnull(r["question"]):
-                if r["question"][0] in list(map(str, range(1, 7))):
-                    if isinstance(r["answer"], str) and r["answer"] != null_str:
-                        answer = int(re.search("\d+", r["answer"]).group())
-                    else:
-                        answer = ""
-                    feedback_curated_row.append(answer)
-                elif r["question"][0].isdigit() and int(r["question"][0]) > 6:
-                    if r["answer"] == "--" or r["answer"] == null_str:
-                        answer = ""
-                    else:
-                        answer = r["answer"]
-                    feedback_curated_row.append(answer)
-        feedback_curated_records = pd.DataFrame([feedback_curated_row],
-                                                columns = feedback_cols)
-        feedback_curated = feedback_curated.append(feedback_curated_records)
-    return meds_curated, sleep_curated, feedback_curated
-
-
-def parse_float_to_int(i):
-    str_i = str(i)
-    if "nan" == str_i:
-        str_i = ""
-    elif str_i.endswith(".0"):
-        str_i = str_i[:-2]
-    return(str_i)
-
-
-def clean_numeric_cols(df, cols):
-    df = copy.deepcopy(df)
-    for c in cols:
-        df[c] = df[c].apply(parse_float_to_int)
-    return(df)
+        key = None
+        if journal is not None:
+            key = "{}.{}".format(
+                manifest_key(syn.get(metadata_id, downloadFile = False)), diary_num)
+            keys.append(key)
+        record = journal.get(key) if journal is not None else None
+        if record is None:
+            f = syn.get(metadata_id)
+            workbook = Workbook(f.path)
+            meds = workbook.read_sheet("Home Diary - Meds", skiprows=3)
+            sleep = workbook.read_sheet("Home Diary - Sleep", skiprows=3)
+            feedback = workbook.read_sheet("Feedback_Questionnaire",
+                                           skiprows=2, usecols = "A:B")
+            timezone = subject_timezone(workbook, subject_id)
+            workbook.close()
+            record = (curate_meds(meds, subject_id, meds_cols, timezone = timezone),
+                      extract_sleep_events(sleep, subject_id, diary_num,
+                                           timezone = timezone),
+                      curate_feedback(feedback, subject_id))
+            if journal is not None:
+                journal.put(key, record)
+        meds_curated.append_frame(record[0])
+        sleep_events.append_frame(record[1])
+        feedback_curated.append(record[2])
+    if journal is not None:
+        journal.compact(keys)
+    sleep_curated = pair_sleep_events(sleep_events.to_frame(), sleep_cols)
+    return meds_curated.to_frame(), sleep_curated, feedback_curated.to_frame()
 
 
 def store_tables(syn, raw_data_curated, meds_curated,
-                 sleep_curated, feedback_curated):
+                 sleep_curated, feedback_curated, spool_dir = None, workers = 4,
+                 incremental = False):
+    tables = []
     # sensor measurements
     raw_data_cols = [
             sc.Column(name = "subject_id", columnType = "STRING", maximumSize = 6),
@@ -252,10 +201,12 @@ def store_tables(syn, raw_data_curated, meds_curated,
             sc.Column(name = "timestamp_end", columnType = "DOUBLE"),
             sc.Column(name = "source_file", columnType = "ENTITYID"),
             sc.Column(name = "data_file_handle_id", columnType = "FILEHANDLEID")]
+    raw_data_cols += [
+            sc.Column(name = c, columnType = "INTEGER" if c.endswith("_count") else "DOUBLE")
+            for c in raw_data_curated.columns if is_summary_column(c)]
     raw_data_schema = sc.Schema(name = "Sensor Measurements", columns = raw_data_cols,
                                 parent = PROJECT)
-    raw_data_table = sc.Table(raw_data_schema, raw_data_curated)
-    syn.store(raw_data_table)
+    tables.append((raw_data_schema, serialize_columns(raw_data_curated, raw_data_cols)))
     # medication diary
     meds_cols = [
             sc.Column(name = "subject_id", columnType = "STRING", maximumSize = 6),
@@ -264,21 +215,19 @@ def store_tables(syn, raw_data_curated, meds_curated,
                       maximumSize = 120),
             sc.Column(name = "other_medications", columnType = "STRING",
                       maximumSize = 120)]
-    meds_curated_clean = clean_numeric_cols(meds_curated, ["timestamp"])
+    meds_curated_clean = serialize_columns(meds_curated, meds_cols)
     meds_schema = sc.Schema(name = "Medication Diary", columns = meds_cols,
                             parent = PROJECT)
-    meds_table = sc.Table(meds_schema, meds_curated_clean)
-    syn.store(meds_table)
+    tables.append((meds_schema, meds_curated_clean))
     # sleep diary
     sleep_cols = [
             sc.Column(name = "subject_id", columnType = "STRING", maximumSize = 6),
             sc.Column(name = "sleep", columnType = "INTEGER"),
             sc.Column(name = "wake", columnType = "INTEGER")]
-    sleep_curated_clean = clean_numeric_cols(sleep_curated, ["sleep", "wake"])
+    sleep_curated_clean = serialize_columns(sleep_curated, sleep_cols)
     sleep_schema = sc.Schema(name = "Sleep Diary", columns = sleep_cols,
                        parent = PROJECT)
-    sleep_table = sc.Table(sleep_schema, sleep_curated_clean)
-    syn.store(sleep_table)
+    tables.append((sleep_schema, sleep_curated_clean))
     # feedback survey
     feedback_cols = [
             sc.Column(name = "subject_id", columnType = "STRING", maximumSize = 6),
@@ -291,22 +240,81 @@ def store_tables(syn, raw_data_curated, meds_curated,
             sc.Column(name = "additional_feedback_device_phone", columnType = "LARGETEXT"),
             sc.Column(name = "additional_feedback_diary", columnType = "LARGETEXT"),
             sc.Column(name = "additional_feedback_experiment", columnType = "LARGETEXT")]
-    feedback_curated_clean = clean_numeric_cols(
-            feedback_curated,
-            ["charge_smartphone", "charge_pebble", "charge_pebble",
-             "experience_watches", "experience_devices", "clearness_diary",
-             "accuracy_diary"])
+    feedback_curated_clean = serialize_columns(feedback_curated, feedback_cols)
     feedback_schema = sc.Schema(name = "Feedback Survey", columns = feedback_cols,
                        parent = PROJECT)
-    feedback_table = sc.Table(feedback_schema, feedback_curated_clean)
-    syn.store(feedback_table)
+    tables.append((feedback_schema, feedback_curated_clean))
+    # -> {table name: (inserts, updates, deletes)} of the tables stored
+    # incrementally, tables that don't exist yet are uploaded in full
+    changes = {}
+    if incremental:
+        for schema, df in tables:
+            changes[schema["name"]] = store_incremental(
+                    syn, schema, df, NATURAL_KEYS[schema["name"]])
+        tables = [(schema, df) for schema, df in tables
+                  if changes[schema["name"]] is None]
+    TableUploader(syn, spool_dir = spool_dir, workers = workers).upload(tables)
+    return({name: c for name, c in changes.items() if c is not None})
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "Number of processes used to parse sensor files.")
+    parser.add_argument("--prefetch", type = int, default = PREFETCH,
+                        help = "Sensor files downloaded ahead of the parsers.")
+    parser.add_argument("--disk-budget-gb", type = float, default = None,
+                        help = "Keep downloaded sensor files under this size, "
+                               "deleting the least recently used ones.")
+    parser.add_argument("--cache-dir", default = ".curation_cache",
+                        help = "Directory for caches reused across runs.")
+    parser.add_argument("--report", default = None,
+                        help = "Where to write the JSON timing report. Defaults to "
+                               "<cache-dir>/<project>_report.json.")
+    parser.add_argument("--no-instrumentation", action = "store_true")
+    parser.add_argument("--export-dir", default = None,
+                        help = "Also export the raw sensor files to a partitioned "
+                               "Parquet dataset here.")
+    args = parser.parse_args()
     syn = sc.login()
-    raw_data_curated = curate_raw_data(syn)
-    scores_clinic_curated, scores_home_curated = curate_scores(syn)
-    meds_curated, sleep_curated, feedback_curated = curate_metadata(syn)
+    instrumentation = None if args.no_instrumentation else Instrumentation()
+    download_cache = None
+    if args.disk_budget_gb is not None:
+        # shared by the raw data and export stages, so both stay under budget
+        download_cache = DownloadCache(
+                syn, os.path.join(args.cache_dir, "{}_downloads".format(PROJECT)),
+                int(args.disk_budget_gb * 1024 ** 3))
+    pipeline = Pipeline(
+            cache_dir = os.path.join(args.cache_dir, "{}_stages".format(PROJECT)),
+            instrumentation = instrumentation)
+    pipeline.add_stage("raw_data", functools.partial(
+            curate_raw_data, syn, workers = args.workers, prefetch = args.prefetch,
+            download_cache = download_cache,
+            manifest_path = os.path.join(
+                args.cache_dir, "{}_scan_manifest.json".format(PROJECT)),
+            copy_mapping_path = os.path.join(
+                args.cache_dir, "{}_file_handle_copies.pkl".format(PROJECT))))
+    if args.export_dir is not None:
+        from sensor_export import export_sensor_files # needs pyarrow
+        pipeline.add_stage(
+                "export",
+                lambda raw_data_curated: export_sensor_files(
+                    syn, raw_data_curated, args.export_dir, workers = args.workers,
+                    download_cache = download_cache),
+                depends_on = ["raw_data"])
+    pipeline.add_stage("scores", functools.partial(curate_scores, syn))
+    pipeline.add_stage("metadata", functools.partial(
+            curate_metadata, syn, journal_path = os.path.join(
+                args.cache_dir, "{}_metadata_journal.pkl".format(PROJECT))))
+    if instrumentation is None:
+        pipeline.run()
+        return
+    try:
+        with instrumentation.patch(syn):
+            pipeline.run()
+    finally:
+        instrumentation.write(args.report or os.path.join(
+            args.cache_dir, "{}_report.json".format(PROJECT)))
 
 
 if __name__ == "__main__":
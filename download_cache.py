@@ -0,0 +1,58 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class DownloadCache(object):
+    # Downloads files into cache_dir and keeps their total size under
+    # budget_bytes by deleting the least recently released ones. A file is
+    # in flight from get() until release() and is never evicted then, so the
+    # budget can be exceeded while every cached file is still in use. Files
+    # that end up outside cache_dir (e.g. already present elsewhere locally)
+    # are not tracked or deleted.
+
+    def __init__(self, syn, cache_dir, budget_bytes):
+        self.syn = syn
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.budget_bytes = budget_bytes
+        self.evicted = 0
+        self._sizes = {}
+        self._in_flight = {}
+        self._released = OrderedDict() # least recently released first
+        self._lock = threading.Lock()
+
+    def _owned(self, path):
+        return(os.path.abspath(path).startswith(self.cache_dir + os.sep))
+
+    def _evict(self):
+        # call with the lock held
+        total = sum(self._sizes.values())
+        while total > self.budget_bytes and self._released:
+            path, _ = self._released.popitem(last = False)
+            total -= self._sizes.pop(path)
+            if os.path.exists(path):
+                os.remove(path)
+            self.evicted += 1
+
+    def get(self, file_id, **kwargs):
+        syn_file = self.syn.get(file_id, downloadLocation = os.path.join(
+            self.cache_dir, file_id), **kwargs)
+        path = syn_file.path
+        if path is not None and self._owned(path):
+            with self._lock:
+                self._in_flight[path] = self._in_flight.get(path, 0) + 1
+                self._released.pop(path, None)
+                self._sizes[path] = os.path.getsize(path)
+                self._evict()
+        return(syn_file)
+
+    def release(self, path):
+        # the caller is done with path, it may be evicted from now on
+        if path is None or not self._owned(path):
+            return
+        with self._lock:
+            self._in_flight[path] -= 1
+            if self._in_flight[path] == 0:
+                del self._in_flight[path]
+                self._released[path] = True
+                self._evict()
@@ -0,0 +1,186 @@
+import hashlib
+import itertools
+import os
+import re
+import pandas as pd
+
+
+FOLDER_TYPE = "org.sagebionetworks.repo.model.Folder"
+FILE_TYPE = "org.sagebionetworks.repo.model.FileEntity"
+TABLE_TYPE = "org.sagebionetworks.repo.model.table.TableEntity"
+TABLES_DIR = "_tables"
+STORED_DIR = "_stored"
+
+
+class FakeEntity(dict):
+    # dict with attribute access, like the synapseclient entities the
+    # curation scripts read (syn_file.path, syn_file['dataFileHandleId'])
+
+    def __getattr__(self, key):
+        try:
+            return(self[key])
+        except KeyError:
+            raise AttributeError(key)
+
+
+class FakeQueryResult(object):
+
+    def __init__(self, df):
+        self._df = df
+
+    def asDataFrame(self):
+        return(self._df.copy())
+
+
+class FakeSynapse(object):
+    # Filesystem-backed stand-in for the parts of synapseclient used by the
+    # curation scripts. Every entry directly under root is an entity named by
+    # its Synapse ID; nested folders and files are given stable IDs in sorted
+    # path order. Reference tables live in root/_tables/<synId>.tsv and stored
+    # tables are written to root/_stored/<parent>/<name>.csv, which a table
+    # created by this instance starts over.
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.paths = {}
+        self.ids = {}
+        self.stored = {}
+        self._file_handle_ids = {}
+        self._new_ids = itertools.count(900000000)
+        self._index()
+
+    def _index(self):
+        nested = []
+        for name in sorted(os.listdir(self.root)):
+            if name in (TABLES_DIR, STORED_DIR):
+                continue
+            path = os.path.join(self.root, name)
+            self._register(name, path)
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    for child in sorted(dirnames + filenames):
+                        nested.append(os.path.join(dirpath, child))
+        for i, path in enumerate(sorted(nested)):
+            self._register("syn{}".format(800000000 + i), path)
+        tables_dir = os.path.join(self.root, TABLES_DIR)
+        if os.path.isdir(tables_dir):
+            for name in sorted(os.listdir(tables_dir)):
+                self._register(name.split(".")[0], os.path.join(tables_dir, name))
+
+    def _register(self, entity_id, path):
+        self.paths[entity_id] = path
+        self.ids[path] = entity_id
+        self._file_handle_ids[entity_id] = str(700000000 + len(self._file_handle_ids))
+
+    def _concrete_type(self, path):
+        if os.path.isdir(path):
+            return(FOLDER_TYPE)
+        if os.path.dirname(path) == os.path.join(self.root, TABLES_DIR):
+            return(TABLE_TYPE)
+        return(FILE_TYPE)
+
+    def get(self, entity, downloadFile = True, **kwargs):
+        entity_id = entity["id"] if isinstance(entity, dict) else entity
+        path = self.paths[entity_id]
+        stat = os.stat(path)
+        version = "{}.{}".format(stat.st_size, stat.st_mtime_ns)
+        entity = FakeEntity(
+                id = entity_id, name = os.path.basename(path),
+                concreteType = self._concrete_type(path),
+                versionNumber = 1,
+                etag = hashlib.md5(version.encode()).hexdigest())
+        if entity["concreteType"] == FILE_TYPE:
+            entity["dataFileHandleId"] = self._file_handle_ids[entity_id]
+            entity["_file_handle"] = {"id": entity["dataFileHandleId"],
+                                      "contentMd5": entity["etag"],
+                                      "contentSize": stat.st_size}
+            entity["path"] = path if downloadFile else None
+        return(entity)
+
+    def getChildren(self, parent, includeTypes = None, **kwargs):
+        parent_path = self.paths[parent]
+        for name in sorted(os.listdir(parent_path)):
+            path = os.path.join(parent_path, name)
+            concrete_type = self._concrete_type(path)
+            yield {"id": self.ids[path], "name": name, "concreteType": concrete_type,
+                   "type": concrete_type}
+
+    def tableQuery(self, query, **kwargs):
+        match = re.match(r"select\s+(.+?)\s+from\s+(syn\d+)", query.strip(), re.I)
+        columns, table_id = match.groups()
+        if table_id in self.stored:
+            df = pd.read_csv(self._stored_path(table_id))
+        else:
+            df = pd.read_table(self.paths[table_id])
+        if columns.strip() != "*":
+            df = df[[c.strip() for c in columns.split(",")]]
+        return(FakeQueryResult(df))
+
+    def findEntityId(self, name, parent = None):
+        # like Synapse, parent = None only finds entities without a parent
+        for table_id, stored in self.stored.items():
+            if stored["name"] == name and stored["parent"] == parent:
+                return(table_id)
+        return(None)
+
+    def _stored_path(self, table_id):
+        stored = self.stored[table_id]
+        return(os.path.join(self.root, STORED_DIR, str(stored["parent"]),
+                            "{}.csv".format(stored["name"])))
+
+    def store(self, obj, **kwargs):
+        if hasattr(obj, "asDataFrame"):
+            schema = getattr(obj, "schema", None)
+            if schema is not None and not isinstance(schema, str):
+                self.store(schema)
+                table_id = schema["id"]
+            else:
+                table_id = obj.tableId
+            df = obj.asDataFrame()
+            path = self._stored_path(table_id)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            df.to_csv(path, mode = "a", header = not os.path.exists(path), index = False)
+            self.stored[table_id]["rows"] += len(df)
+            return(obj)
+        parent = obj.get("parentId")
+        if obj.get("id") is None:
+            obj["id"] = self.findEntityId(obj.get("name"), parent) or \
+                    "syn{}".format(next(self._new_ids))
+        if obj["id"] not in self.stored:
+            self.stored[obj["id"]] = {"name": obj.get("name"), "parent": parent,
+                                      "rows": 0}
+            if os.path.exists(self._stored_path(obj["id"])): # from an earlier run
+                os.remove(self._stored_path(obj["id"]))
+        return(obj)
+
+
+def walk(syn, synId, includeTypes = None):
+    # synapseutils.walk over a FakeSynapse
+    root = syn.get(synId, downloadFile = False)
+    for x in _walk(syn, synId, root["name"]):
+        yield x
+
+
+def _walk(syn, synId, dirpath):
+    dirs = []
+    nondirs = []
+    for child in syn.getChildren(synId):
+        if child["concreteType"] == FOLDER_TYPE:
+            dirs.append((child["name"], child["id"]))
+        else:
+            nondirs.append((child["name"], child["id"]))
+    yield (dirpath, synId), dirs, nondirs
+    for name, child_id in dirs:
+        for x in _walk(syn, child_id, os.path.join(dirpath, name)):
+            yield x
+
+
+def copyFileHandles(syn, fileHandles, associateObjectTypes, associateObjectIds,
+                    contentTypes = None, fileNames = None):
+    # synapseutils.copyFileHandles over a FakeSynapse
+    results = []
+    for fhid in fileHandles:
+        results.append({"originalFileHandleId": str(fhid),
+                        "newFileHandle": {"id": str(next(syn._new_ids))}})
+    return({"copyResults": results})
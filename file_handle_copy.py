@@ -0,0 +1,98 @@
+import threading
+import time
+import synapseutils as su
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from checkpoint import Journal
+
+
+COPY_BATCH_SIZE = 100
+
+
+def _copy_batch(syn, batch, content_type, copy_function, retries, backoff):
+    # returns ({original file handle ID: new file handle ID} for every item
+    # of the batch that could be copied, the error of the last attempt or
+    # None), retrying only the items that failed. Handles copied before the
+    # last attempt raised are returned as well, so they aren't copied again.
+    copied = {}
+    error = None
+    remaining = batch
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response = copy_function(
+                    syn = syn,
+                    fileHandles = [fhid for fhid, _ in remaining],
+                    associateObjectTypes = ["FileEntity"] * len(remaining),
+                    associateObjectIds = [source for _, source in remaining],
+                    contentTypes = [content_type] * len(remaining),
+                    fileNames = [None] * len(remaining))
+        except Exception as e:
+            error = e
+            continue
+        error = None
+        for result in response['copyResults']:
+            if result.get('newFileHandle') is not None:
+                copied[str(result['originalFileHandleId'])] = \
+                        int(result['newFileHandle']['id'])
+        remaining = [(fhid, source) for fhid, source in remaining
+                     if str(fhid) not in copied]
+        if not remaining:
+            break
+    return(copied, error)
+
+
+class FileHandleCopier(object):
+    # copies file handles in concurrent batches and persists the
+    # source -> copy mapping so handles copied by an earlier run are reused.
+    # Each batch's copies are appended to a Journal at mapping_path, keyed by
+    # the batch's first handle, so saving doesn't rewrite earlier batches.
+
+    def __init__(self, syn, mapping_path = None, workers = 4, retries = 4,
+                 backoff = 1.0, batch_size = COPY_BATCH_SIZE,
+                 copy_function = None):
+        self.syn = syn
+        self.mapping_path = mapping_path
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.copy_function = copy_function or su.copyFileHandles
+        self.mapping = {}
+        self._lock = threading.Lock()
+        self._journal = Journal(mapping_path) if mapping_path is not None else None
+        if self._journal is not None:
+            for copied in self._journal.entries.values():
+                self.mapping.update(copied)
+
+    def copy(self, fhids, source_files,
+             content_type = "text/tab-separated-values"):
+        to_copy = []
+        seen = set()
+        for fhid, source in zip(fhids, source_files):
+            if str(fhid) not in self.mapping and str(fhid) not in seen:
+                seen.add(str(fhid))
+                to_copy.append((fhid, source))
+        batches = [to_copy[i:i+self.batch_size]
+                   for i in range(0, len(to_copy), self.batch_size)]
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers = self.workers) as pool:
+                futures = [pool.submit(_copy_batch, self.syn, batch, content_type,
+                                       self.copy_function, self.retries, self.backoff)
+                           for batch in batches]
+                for future in as_completed(futures):
+                    copied, batch_error = future.result()
+                    error = batch_error or error # keep recording the other batches
+                    with self._lock:
+                        self.mapping.update(copied)
+                    if copied and self._journal is not None:
+                        self._journal.put(next(iter(copied)), copied)
+        finally:
+            if self._journal is not None:
+                self._journal.close()
+        failed = [fhid for fhid in fhids if str(fhid) not in self.mapping]
+        if failed:
+            raise RuntimeError("Could not copy {} file handles, starting with {}".format(
+                len(failed), failed[0])) from error
+        return({fhid: self.mapping[str(fhid)] for fhid in fhids})
@@ -0,0 +1,167 @@
+import contextlib
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import pandas as pd
+import synapseutils as su
+from workbook import Workbook
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, worker pools show up under children
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return(usage / 1024.0)
+
+
+def count_rows(result):
+    if result is None:
+        return(0)
+    if isinstance(result, tuple):
+        return(sum(count_rows(r) for r in result))
+    try:
+        return(len(result))
+    except TypeError: # e.g. a chunked reader
+        return(0)
+
+
+def file_size(path):
+    if isinstance(path, str) and os.path.isfile(path):
+        return(os.path.getsize(path))
+    return(0)
+
+
+_active = None
+
+
+def timed_call(function, *args, **kwargs):
+    # -> (result, seconds, peak RSS in MB) of a call, measured in whichever
+    # process runs it so work done in worker pools can be reported by the
+    # parent with report()
+    start = time.time()
+    result = function(*args, **kwargs)
+    return(result, time.time() - start, peak_rss_mb())
+
+
+def report(name, seconds, bytes = 0, rows = 0, peak = None):
+    # adds a call timed elsewhere to the Instrumentation currently patched in
+    if _active is not None:
+        _active.add(name, seconds, bytes, rows, peak)
+
+
+class Measurement(object):
+    # filled in by the caller while a block is being timed
+
+    def __init__(self):
+        self.bytes = 0
+        self.rows = 0
+
+
+class Instrumentation(object):
+    # Accumulates wall time, call counts, bytes, rows and the process peak
+    # memory per named operation. Each call only costs a clock read and a
+    # getrusage, so it is left on for production runs. Per-file parsing,
+    # which may run in worker processes, is timed with timed_call() where it
+    # runs and reported through report().
+
+    def __init__(self):
+        self.started = time.time()
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        measurement = Measurement()
+        start = time.time()
+        try:
+            yield measurement
+        finally:
+            self.add(name, time.time() - start, measurement.bytes, measurement.rows)
+
+    def add(self, name, seconds, bytes = 0, rows = 0, peak = None):
+        peak = max(peak or 0.0, peak_rss_mb())
+        with self._lock:
+            stats = self.stats.setdefault(name, {
+                "calls": 0, "seconds": 0.0, "bytes": 0, "rows": 0,
+                "peak_rss_mb": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["bytes"] += bytes
+            stats["rows"] += rows
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"], peak)
+
+    def wrap(self, name, function, input_bytes = None, output_bytes = None,
+             skip = None):
+        # input_bytes(args, kwargs) and output_bytes(result) size a call,
+        # calls for which skip(args, kwargs) is true are not measured
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if skip is not None and skip(args, kwargs):
+                return(function(*args, **kwargs))
+            with self.measure(name) as m:
+                if input_bytes is not None:
+                    m.bytes += input_bytes(args, kwargs)
+                result = function(*args, **kwargs)
+                if output_bytes is not None:
+                    m.bytes += output_bytes(result)
+                if isinstance(result, (pd.DataFrame, pd.Series)):
+                    m.rows = len(result)
+            return(result)
+        return(wrapper)
+
+    @contextlib.contextmanager
+    def patch(self, syn):
+        # instruments syn.get, syn.store, pd.read_table, the Workbook reader
+        # (our read_excel, opening a workbook and reading its sheets) and
+        # su.copyFileHandles until the block exits, and makes this the
+        # Instrumentation report() adds to. Chunked read_table calls only
+        # build a reader, the sensor file parses that use them are recorded
+        # as parse_sensor_file and export_sensor_file instead.
+        global _active
+        patches = [
+            (syn, "get", self.wrap(
+                "syn.get", syn.get,
+                output_bytes = lambda e: file_size(getattr(e, "path", None)))),
+            (syn, "store", self.wrap(
+                "syn.store", syn.store,
+                input_bytes = lambda args, kwargs: file_size(
+                    getattr(args[0], "filepath", None)))),
+            (pd, "read_table", self.wrap(
+                "read_table", pd.read_table,
+                input_bytes = lambda args, kwargs: file_size(args[0] if args else None),
+                skip = lambda args, kwargs: kwargs.get("chunksize") is not None)),
+            (Workbook, "__init__", self.wrap(
+                "read_excel", Workbook.__init__,
+                input_bytes = lambda args, kwargs: file_size(args[1]))),
+            (Workbook, "read_sheet", self.wrap("read_excel", Workbook.read_sheet)),
+            (su, "copyFileHandles", self.wrap("copyFileHandles", su.copyFileHandles))]
+        originals = [(target, attr, vars(target).get(attr)) for target, attr, _ in patches]
+        previous = _active
+        try:
+            for target, attr, wrapped in patches:
+                setattr(target, attr, wrapped)
+            _active = self
+            yield self
+        finally:
+            _active = previous
+            for target, attr, original in originals:
+                if original is None: # was looked up on syn's class
+                    delattr(target, attr)
+                else:
+                    setattr(target, attr, original)
+
+    def summary(self):
+        return({"started": self.started, "seconds": time.time() - self.started,
+                "peak_rss_mb": peak_rss_mb(), "operations": self.stats})
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.summary(), f, indent = 2, sort_keys = True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+
+class _SubjectIntervals(object):
+    # one subject's files sorted by start time. max_end[i] is the latest end
+    # of files 0..i, so it is sorted too and both bounds of a query window
+    # can be found by binary search
+
+    def __init__(self, rows, starts, ends):
+        order = np.argsort(starts, kind = "mergesort")
+        self.rows = rows[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.max_end = np.maximum.accumulate(self.ends)
+
+    def candidates(self, window_start, window_end):
+        # [lo, hi) bounds the files that can overlap each window, ends still
+        # have to be checked since a long earlier file can raise max_end
+        lo = np.searchsorted(self.max_end, window_start, side = "left")
+        hi = np.searchsorted(self.starts, window_end, side = "right")
+        return(lo, np.maximum(hi, lo))
+
+
+class SensorIntervalIndex(object):
+    # Index over the output of curate_raw_data for finding the sensor files
+    # that overlap a time window. Files are grouped by subject and can be
+    # narrowed by device and device_position. Windows are closed: a file
+    # overlaps [start, end] when file_start <= end and file_end >= start.
+
+    def __init__(self, raw_data):
+        self.raw_data = raw_data.reset_index(drop = True)
+        if "device_position" not in self.raw_data:
+            self.raw_data["device_position"] = np.nan
+        self.subjects = {}
+        for subject_id, group in self.raw_data.groupby("subject_id", sort = False):
+            self.subjects[subject_id] = _SubjectIntervals(
+                    group.index.values, group["timestamp_start"].values.astype(float),
+                    group["timestamp_end"].values.astype(float))
+
+    def overlapping(self, subject_id, timestamp_start, timestamp_end,
+                    device = None, device_position = None):
+        intervals = self.subjects.get(subject_id)
+        if intervals is None:
+            return(self.raw_data.iloc[[]])
+        lo, hi = intervals.candidates(timestamp_start, timestamp_end)
+        keep = slice(lo, hi)
+        rows = intervals.rows[keep][intervals.ends[keep] >= timestamp_start]
+        result = self.raw_data.loc[np.sort(rows)]
+        if device is not None:
+            result = result[result["device"] == device]
+        if device_position is not None:
+            result = result[result["device_position"] == device_position]
+        return(result)
+
+    def join(self, scores, suffix = "_file"):
+        # every (score row, overlapping file) pair, in score order. Scores
+        # carry subject_id, timestamp_start and timestamp_end, the file's
+        # own columns get suffix where the names clash.
+        scores = scores.reset_index(drop = True)
+        score_rows, file_rows = [], []
+        for subject_id, group in scores.groupby("subject_id", sort = False):
+            intervals = self.subjects.get(subject_id)
+            if intervals is None:
+                continue
+            window_start = group["timestamp_start"].values.astype(float)
+            window_end = group["timestamp_end"].values.astype(float)
+            lo, hi = intervals.candidates(window_start, window_end)
+            counts = hi - lo
+            # expand each window into its candidate positions lo..hi-1
+            positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                            counts)
+            positions += np.repeat(lo, counts)
+            windows = np.repeat(np.arange(len(group)), counts)
+            hit = intervals.ends[positions] >= window_start[windows]
+            score_rows.append(group.index.values[windows[hit]])
+            file_rows.append(intervals.rows[positions[hit]])
+        if score_rows:
+            score_rows = np.concatenate(score_rows)
+            file_rows = np.concatenate(file_rows)
+        order = np.argsort(score_rows, kind = "mergesort")
+        left = scores.iloc[np.asarray(score_rows, dtype = int)[order]].reset_index(drop = True)
+        right = self.raw_data.drop("subject_id", axis = 1).iloc[
+                np.asarray(file_rows, dtype = int)[order]].reset_index(drop = True)
+        right.columns = [c + suffix if c in left.columns else c for c in right.columns]
+        return(pd.concat([left, right], axis = 1))
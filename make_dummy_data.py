@@ -1,8 +1,285 @@
-pebble_data = synread("syn17104010")
-pebble_data = pebble_data[:1000]
-pebble_data.set_index("timestamp", inplace = True)
-pebble_data = pebble_data.astype(float)
-dummy_pebble_data = pebble_data.apply(lambda c : c + random.randn(len(c)) * 0.1)
-dummy_pebble_data.to_csv("dummyPebbleData_Day1.txt", sep = "\t")
-f = sc.File("dummyPebbleData_Day1.txt", parent = "syn18085868")
-syn.store(f)
+import argparse
+import datetime
+import os
+import numpy as np
+import pandas as pd
+import openpyxl
+import curate_intel
+import curate_shimmer
+from fake_synapse import TABLES_DIR
+
+
+SAMPLE_RATES = {"GENEActiv": 50.0, "Pebble": 50.0, "Phone": 50.0, "Shimmer": 51.2}
+# each device gets its own sensor columns, so column layouts differ across files
+SENSOR_COLUMNS = {"GENEActiv": ["x", "y", "z", "light", "temperature"],
+                  "Pebble": ["x", "y", "z"],
+                  "Phone": ["x", "y", "z", "magnitude"],
+                  "Shimmer": ["x", "y", "z", "gyro_x", "gyro_y", "gyro_z"]}
+# free-text timezones as subjects entered them, cycled through by subject
+TIMEZONES = ["America/New_York", "CST", "America/Denver", "Pacific", "EDT"]
+CHUNK_ROWS = 1000000
+START_DATE = datetime.datetime(2017, 6, 5, 8, 0, 0)
+TASK_CODES = ["ftnr", "ftnl", "ramr", "raml", "drnkg", "fldng", "ntblt",
+              "orgpa", "wlkgs", "wlkgc"]
+SELECT_FROM_LIST = "<Select from list>"
+
+
+def write_sensor_file(path, rate, start, seconds, rng, chunk_rows = CHUNK_ROWS,
+                      columns = ("x", "y", "z")):
+    # written chunk by chunk so files of any size never sit in memory
+    n = int(seconds * rate)
+    with open(path, "w") as f:
+        for i in range(0, max(n, 1), chunk_rows):
+            rows = np.arange(i, min(i + chunk_rows, n))
+            chunk = pd.DataFrame({"timestamp": start + rows / rate})
+            for c in columns:
+                chunk[c] = rng.normal(1 if c == "z" else 0, 0.3, len(rows)).astype(
+                        np.float32)
+            chunk.to_csv(f, sep = "\t", index = False, header = i == 0,
+                         float_format = "%.4f")
+
+
+def subject_start(subject_num):
+    start = START_DATE + datetime.timedelta(days = 7 * subject_num)
+    return(start, start.replace(tzinfo = datetime.timezone.utc).timestamp())
+
+
+def write_raw_data(root, folder_id, subject_folders, device, file_prefix, days,
+                   hours_per_day, rng, chunk_rows = CHUNK_ROWS):
+    for subject_num, folder_name in subject_folders:
+        subject_dir = os.path.join(root, folder_id, folder_name)
+        os.makedirs(subject_dir, exist_ok = True)
+        _, start = subject_start(subject_num)
+        for day in range(1, days + 1):
+            path = os.path.join(subject_dir, "{}_Day{}.txt".format(file_prefix, day))
+            write_sensor_file(path, SAMPLE_RATES[device], start + (day - 1) * 86400,
+                              hours_per_day * 3600, rng, chunk_rows,
+                              SENSOR_COLUMNS[device])
+
+
+def make_tasks(subject_nums, rng, visits = 2, sessions = 4):
+    records = []
+    for subject_num in subject_nums:
+        _, start = subject_start(subject_num)
+        for visit in range(1, visits + 1):
+            t = start + (visit - 1) * 86400 + 600
+            for session in range(1, sessions + 1):
+                for task_id, task_code in enumerate(TASK_CODES):
+                    duration = float(rng.integers(20, 60))
+                    records.append([subject_num, visit, session, task_id, task_code,
+                                    t, t + duration])
+                    t += duration + 5
+                t += 1800
+    return(pd.DataFrame(records, columns = ["subject_id", "visit", "session", "task_id",
+                                            "task_code", "time_start", "time_end"]))
+
+
+def add_scores(tasks, columns, rng):
+    scores = rng.integers(0, 5, size = (len(tasks), len(columns))).astype(float)
+    scores[rng.random(scores.shape) < 0.1] = np.nan
+    return(pd.concat([tasks, pd.DataFrame(scores, columns = columns)], axis = 1))
+
+
+def write_questionnaire_sheet(book, subject_num, timezone):
+    start, _ = subject_start(subject_num)
+    values = ["PD", "Female", 1950, "Right", 70, 30, 25, 90, 45, 40, 170, 70,
+              start.day, start.month, start.year, 1, 1, 2010, "Right",
+              "Yes", "No", "Yes", "Yes", "No", "No", "Yes", "Yes", "None",
+              datetime.time(7, 30), start.day, start.month, start.year,
+              "Levodopa", 1, 2, "Left", "Right", "Pocket", "08:00", "20:00",
+              timezone, "09:00", 10, 12, 30, 4, 2, "14:00", 28]
+    skipped = [0, 1, 2, 3, 17, 21, 22, 36, 37, 43, 44, 53, 54, 61, 62]
+    sheet = book.create_sheet("Subject_Questionnaire")
+    remaining = iter([("Question", "Answer")] +
+                     [("Item {}".format(i), v) for i, v in enumerate(values)])
+    for row in range(len(values) + 1 + len(skipped)):
+        if row in skipped:
+            sheet.append(["Section"])
+        else:
+            sheet.append(list(next(remaining)))
+
+
+def write_controlled_session_sheet(book, name, start, timezone):
+    sheet = book.create_sheet(name)
+    rows = [[None] * 13 for _ in range(13)]
+    rows[0][0] = "Controlled session"
+    column_c = ["Value", start.day, start.month, start.year,
+                datetime.time(9, 0), datetime.time(9, 15), "Levodopa", "100mg",
+                timezone]
+    for i, value in enumerate(column_c):
+        rows[3 + i][2] = value
+    rows[8][3] = datetime.time(13, 0)
+    rows[4][7] = "Time"
+    for i, value in enumerate([datetime.time(9, 30), datetime.time(9, 31),
+                               datetime.time(9, 32)]):
+        rows[5 + i][7] = value
+    rows[4][12] = "Comments"
+    rows[5][12] = "No comments"
+    rows[12][2] = "End"
+    for row in rows:
+        sheet.append(row)
+
+
+def write_clinic_diary_sheet(book, name, start, timezone, rng):
+    sheet = book.create_sheet(name)
+    rows = [[None] * 9 for _ in range(12)]
+    for i, value in enumerate([start.day, start.month, start.year, timezone]):
+        rows[4 + i][2] = value
+    for i in range(8):
+        row = [None] * 9
+        row[1 + int(rng.integers(0, 4))] = "Y"
+        row[5:8] = list(rng.choice(["Y", "N"], 3))
+        row[8] = "Felt fine" if i == 0 else None # comments, column I
+        rows.append(row)
+    for row in rows:
+        sheet.append(row)
+
+
+def write_home_diary_sheets(book, start, days):
+    meds = book.create_sheet("Home Diary - Meds")
+    for _ in range(3):
+        meds.append(["Home diary"])
+    meds.append(["Day (DD)", "Month (MM)", "Year (YYYY)", "Time (hh:mm - 24 hour format)",
+                 "PD-related medications taken", "Other medications taken"])
+    sleep = book.create_sheet("Home Diary - Sleep")
+    for _ in range(3):
+        sleep.append(["Home diary"])
+    sleep.append(["Day (DD)", "Month (MM)", "Year (YYYY)",
+                  "Time fallen asleep (hh:mm - 24 hour format)",
+                  "Time woke up (hh:mm - 24 hour format)"])
+    for day in range(days):
+        date = start + datetime.timedelta(days = day)
+        for hour in (8, 14, 20):
+            meds.append([date.day, date.month, date.year, datetime.time(hour, 0),
+                         "Levodopa 100mg", None])
+        # the night's wake time goes on the next day's row
+        wake = date + datetime.timedelta(days = 1)
+        sleep.append([date.day, date.month, date.year, datetime.time(23, 10), None])
+        sleep.append([wake.day, wake.month, wake.year, None, datetime.time(7, 5)])
+    sleep.append([SELECT_FROM_LIST, SELECT_FROM_LIST, SELECT_FROM_LIST])
+
+
+def write_feedback_sheet(book):
+    sheet = book.create_sheet("Feedback_Questionnaire")
+    sheet.append(["Feedback"])
+    sheet.append([None])
+    sheet.append(["Question", "Answer"])
+    for q in range(1, 7):
+        sheet.append(["{}. Rating".format(q), "{} - Fine".format(q % 5 + 1)])
+    for q in range(7, 10):
+        sheet.append(["{}. Comments".format(q), "--" if q == 8 else "All good"])
+
+
+def write_metadata_workbook(path, subject_num, days, rng, timezone = TIMEZONES[0]):
+    start, _ = subject_start(subject_num)
+    book = openpyxl.Workbook()
+    book.remove(book.active)
+    write_questionnaire_sheet(book, subject_num, timezone)
+    for i, name in enumerate(["1st", "2nd"]):
+        visit = start + datetime.timedelta(days = i)
+        write_controlled_session_sheet(
+                book, "{} Controlled_Session".format(name), visit, timezone)
+        write_clinic_diary_sheet(
+                book, "{} In Clinic Subject Diary".format(name), visit, timezone, rng)
+    write_home_diary_sheets(book, start, days)
+    write_feedback_sheet(book)
+    book.save(path)
+
+
+def write_table(root, entity_id, df, tables = False):
+    directory = os.path.join(root, TABLES_DIR) if tables else root
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, "{}.tsv".format(entity_id) if tables else entity_id)
+    df.to_csv(path, sep = "\t", index = False)
+
+
+def write_metadata_workbooks(root, folder_id, subject_nums, days, rng):
+    # one workbook per subject, shared by both datasets, so workbooks already
+    # written for the other dataset are kept
+    metadata_dir = os.path.join(root, folder_id)
+    os.makedirs(metadata_dir, exist_ok = True)
+    for n in subject_nums:
+        path = os.path.join(metadata_dir, "{}{}_metadata.xlsx".format(
+            "ldhp" if n % 2 else "ldny", n))
+        if not os.path.exists(path):
+            write_metadata_workbook(path, n, days, rng,
+                                    timezone = TIMEZONES[n % len(TIMEZONES)])
+
+
+def generate_intel(root, subjects, days, hours_per_day, rng, chunk_rows = CHUNK_ROWS):
+    subject_nums = list(range(1, subjects + 1))
+    folders = [(n, "{}_{}".format(n, "BOS" if n % 2 else "NYC")) for n in subject_nums]
+    for folder_id, device in [(curate_intel.GENE_ACTIVE_PARENT, "GENEActiv"),
+                              (curate_intel.PEBBLE_PARENT, "Pebble"),
+                              (curate_intel.PHONE_PARENT, "Phone")]:
+        write_raw_data(root, folder_id, folders, device, device, days,
+                       hours_per_day, rng, chunk_rows)
+    tasks = make_tasks(subject_nums, rng)
+    tasks["subject_id"] = [n if n % 2 else n + 100 for n in tasks["subject_id"]]
+    write_table(root, curate_intel.TASKS_AND_SCORES, add_scores(
+        tasks, ["tremor_RightUpperLimb", "tremor_LeftUpperLimb", "tremor_LowerLimbs",
+                "dyskinesia_RightUpperLimb", "dyskinesia_LeftUpperLimb",
+                "dyskinesia_LowerLimbs", "bradykinesia_RightUpperLimb",
+                "bradykinesia_LeftUpperLimb", "bradykinesia_LowerLimbs"], rng))
+    write_metadata_workbooks(root, curate_intel.METADATA_PARENT, subject_nums, days, rng)
+    device_sides = pd.DataFrame(
+            [[folder_name, device, rng.choice(["Left", "Right"])]
+             for _, folder_name in folders for device in ["GENEActiv", "Pebble"]],
+            columns = ["patient", "device", "deviceSide"])
+    half = len(device_sides) // 2
+    write_table(root, "syn10495809", device_sides[:half], tables = True)
+    write_table(root, "syn10701954", device_sides[half:], tables = True)
+
+
+def generate_shimmer(root, subjects, days, hours_per_day, rng, chunk_rows = CHUNK_ROWS):
+    subject_nums = list(range(1, subjects + 1))
+    folders = [(n, "patient{}".format(n)) for n in subject_nums]
+    for folder_id, location in zip(
+            [curate_shimmer.SHIMMER_BACK, curate_shimmer.SHIMMER_LEFT_ANKLE,
+             curate_shimmer.SHIMMER_LEFT_WRIST, curate_shimmer.SHIMMER_RIGHT_ANKLE,
+             curate_shimmer.SHIMMER_RIGHT_WRIST],
+            ["Back", "LeftAnkle", "LeftWrist", "RightAnkle", "RightWrist"]):
+        write_raw_data(root, folder_id, folders, "Shimmer", "Shimmer_" + location,
+                       days, hours_per_day, rng, chunk_rows)
+    limbs = ["RightUpperLimb", "LeftUpperLimb", "RightLowerLimb", "LeftLowerLimb"]
+    write_table(root, curate_shimmer.TASKS_AND_SCORES_CLINIC, add_scores(
+        make_tasks(subject_nums, rng),
+        ["{}_{}".format(p, l) for p in ["tremor", "dyskinesia", "bradykinesia"]
+         for l in limbs], rng))
+    home = make_tasks(subject_nums, rng, visits = days, sessions = 1)
+    home = home[["subject_id", "time_start", "time_end"]].copy()
+    home["time_since_last_med_intake"] = rng.integers(0, 4 * 3600, len(home))
+    write_table(root, curate_shimmer.TASKS_AND_SCORES_HOME, add_scores(
+        home, ["tremor", "dyskinesia", "on_off"], rng))
+    write_metadata_workbooks(root, curate_shimmer.METADATA_PARENT, subject_nums,
+                             days, rng)
+
+
+def generate(root, subjects, days, hours_per_day = 24, datasets = ("intel", "shimmer"),
+             seed = 0, chunk_rows = CHUNK_ROWS):
+    rng = np.random.default_rng(seed)
+    os.makedirs(root, exist_ok = True)
+    if "intel" in datasets:
+        generate_intel(root, subjects, days, hours_per_day, rng, chunk_rows)
+    if "shimmer" in datasets:
+        generate_shimmer(root, subjects, days, hours_per_day, rng, chunk_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description = "Write a synthetic dataset laid out for fake_synapse.FakeSynapse.")
+    parser.add_argument("--out", required = True)
+    parser.add_argument("--subjects", type = int, default = 2)
+    parser.add_argument("--days", type = int, default = 1)
+    parser.add_argument("--hours-per-day", type = float, default = 24)
+    parser.add_argument("--datasets", nargs = "+", default = ["intel", "shimmer"],
+                        choices = ["intel", "shimmer"])
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--chunk-rows", type = int, default = CHUNK_ROWS)
+    args = parser.parse_args()
+    generate(args.out, args.subjects, args.days, args.hours_per_day,
+             args.datasets, args.seed, args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
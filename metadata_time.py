@@ -0,0 +1,95 @@
+import datetime
+import functools
+import warnings
+import dateutil.parser
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_TIMEZONE = "America/New_York"
+TIMEZONE_ALIASES = {
+        "EST": "America/New_York", "EDT": "America/New_York",
+        "ET": "America/New_York", "EASTERN": "America/New_York",
+        "CST": "America/Chicago", "CDT": "America/Chicago",
+        "CT": "America/Chicago", "CENTRAL": "America/Chicago",
+        "MST": "America/Denver", "MDT": "America/Denver",
+        "MT": "America/Denver", "MOUNTAIN": "America/Denver",
+        "PST": "America/Los_Angeles", "PDT": "America/Los_Angeles",
+        "PT": "America/Los_Angeles", "PACIFIC": "America/Los_Angeles",
+        "GMT": "UTC", "UTC": "UTC"}
+EPOCH = pd.Timestamp("1970-01-01", tz = "UTC")
+
+
+@functools.lru_cache(maxsize = None)
+def _lookup_timezone(name):
+    name = TIMEZONE_ALIASES.get(name.upper(), name)
+    try:
+        return(pd.Timestamp(0, tz = name).tz)
+    except Exception:
+        warnings.warn("Unknown timezone {!r}, using {} instead".format(
+            name, DEFAULT_TIMEZONE))
+        return(_lookup_timezone(DEFAULT_TIMEZONE))
+
+
+def resolve_timezone(timezone):
+    # free-text timezone fields from the workbooks, falling back to New York
+    if not isinstance(timezone, str) or not timezone.strip():
+        timezone = DEFAULT_TIMEZONE
+    return(_lookup_timezone(timezone.strip()))
+
+
+def _parse_datetime(year, month, day, time):
+    # dateutil's reading of one workbook date and time, for the times the
+    # vectorized parse can't read (10:00, 10:00 AM, ...). A datetime cell
+    # only contributes its time of day.
+    if isinstance(time, datetime.datetime):
+        time = time.time()
+    try:
+        return(pd.Timestamp(dateutil.parser.parse(
+            "{}-{}-{} {}".format(year, month, day, time)).replace(tzinfo = None)))
+    except (ValueError, OverflowError):
+        return(pd.NaT)
+
+
+def _localize(dt, timezone):
+    # as dateutil does: ambiguous times are taken as daylight time and times
+    # skipped by a daylight saving change get the offset in effect after it,
+    # so 02:30 on a spring-forward day is 01:30 standard time
+    local = dt.dt.tz_localize(resolve_timezone(timezone),
+                              ambiguous = np.ones(len(dt), dtype = bool),
+                              nonexistent = "shift_forward")
+    offset = local.dt.tz_localize(None) - local.dt.tz_convert("UTC").dt.tz_localize(None)
+    return((dt - offset - EPOCH.tz_localize(None)).dt.total_seconds().values)
+
+
+def translate_metadata_times(years, months, days, times, timezone = None):
+    # vectors of workbook (year, month, day, hh:mm:ss) -> epoch seconds,
+    # NaN wherever the date or time can't be read. timezone is either one
+    # value for every row or one value per row.
+    dates = pd.to_datetime(pd.DataFrame({
+        "year": pd.to_numeric(pd.Series(years), errors = "coerce").values,
+        "month": pd.to_numeric(pd.Series(months), errors = "coerce").values,
+        "day": pd.to_numeric(pd.Series(days), errors = "coerce").values}),
+        errors = "coerce")
+    times = pd.Series(times).values
+    dt = dates + pd.to_timedelta(pd.Series(times).astype(str).values, errors = "coerce")
+    unread = np.flatnonzero(dt.isnull().values & pd.notnull(times))
+    if len(unread):
+        rows = list(zip(*[pd.Series(v).values[unread] for v in (years, months, days)],
+                        times[unread]))
+        parsed = {row: _parse_datetime(*row) for row in set(rows)}
+        dt.iloc[unread] = [parsed[row] for row in rows]
+    if isinstance(timezone, (list, tuple, np.ndarray, pd.Series)):
+        timezones = pd.Series(timezone).fillna("").astype(str).values
+        timestamps = np.full(len(dt), np.nan)
+        for tz in pd.unique(timezones):
+            in_tz = timezones == tz
+            timestamps[in_tz] = _localize(dt[in_tz], tz)
+    else:
+        timestamps = _localize(dt, timezone)
+    return(np.floor(timestamps))
+
+
+def translate_metadata_time(year, month, day, timestamp, timezone = None):
+    return(translate_metadata_times(
+        [year], [month], [day], [timestamp], timezone = timezone)[0])
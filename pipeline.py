@@ -0,0 +1,94 @@
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from instrumentation import count_rows
+
+
+class Pipeline(object):
+    # Runs curation stages as a dependency graph. A stage starts once all of
+    # its dependencies have finished and receives their outputs as positional
+    # arguments. Outputs are pickled to cache_dir as they finish so a rerun
+    # after a failure only runs the stages that didn't complete. The cache is
+    # removed once every stage has succeeded. Stages are timed under
+    # "stage.<name>" when an Instrumentation is given.
+
+    def __init__(self, cache_dir = None, workers = None, clear_on_success = True,
+                 instrumentation = None):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.clear_on_success = clear_on_success
+        self.instrumentation = instrumentation
+        self.stages = OrderedDict()
+
+    def add_stage(self, name, function, depends_on = ()):
+        missing = [d for d in depends_on if d not in self.stages]
+        if missing:
+            raise ValueError("Stage {} depends on unknown stages {}".format(name, missing))
+        self.stages[name] = (function, list(depends_on))
+
+    def _cache_path(self, name):
+        return(os.path.join(self.cache_dir, "{}.pkl".format(name)))
+
+    def _load(self, name):
+        if self.cache_dir is None or not os.path.exists(self._cache_path(name)):
+            return(False, None)
+        with open(self._cache_path(name), "rb") as f:
+            return(True, pickle.load(f))
+
+    def _save(self, name, result):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok = True)
+        tmp_path = self._cache_path(name) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, self._cache_path(name))
+
+    def _run_stage(self, name, function, args):
+        if self.instrumentation is None:
+            return(function(*args))
+        with self.instrumentation.measure("stage.{}".format(name)) as m:
+            result = function(*args)
+            m.rows = count_rows(result)
+        return(result)
+
+    def clear(self):
+        if self.cache_dir is not None and os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def run(self):
+        results = {}
+        remaining = OrderedDict(self.stages)
+        running = {}
+        workers = self.workers or max(len(self.stages), 1)
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            while remaining or running:
+                ready = [name for name, (_, depends_on) in remaining.items()
+                         if all(d in results for d in depends_on)]
+                for name in ready:
+                    function, depends_on = remaining.pop(name)
+                    is_cached, result = self._load(name)
+                    if is_cached:
+                        results[name] = result
+                    else:
+                        args = [results[d] for d in depends_on]
+                        running[pool.submit(self._run_stage, name, function,
+                                            args)] = name
+                if ready and not running:
+                    continue # cached stages may have unblocked others
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        # keep the output of stages that are still running
+                        for other in as_completed(running):
+                            if other.exception() is None:
+                                self._save(running[other], other.result())
+                        raise future.exception()
+                    results[name] = future.result()
+                    self._save(name, results[name])
+        if self.clear_on_success:
+            self.clear()
+        return(results)
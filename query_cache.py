@@ -0,0 +1,39 @@
+import hashlib
+import os
+import re
+import pandas as pd
+
+
+class QueryCache(object):
+    # On-disk cache of tableQuery results keyed by the query text and the
+    # table's current etag, which changes whenever the table does. Results
+    # are kept as Parquet, or pickles when no Parquet engine is installed.
+    # Without a cache_dir every query goes to Synapse.
+
+    def __init__(self, cache_dir = None):
+        self.cache_dir = cache_dir
+
+    def _path(self, query, table):
+        key = hashlib.md5("{}\n{}.{}".format(
+            query, table.get("versionNumber"), table.get("etag")).encode()).hexdigest()
+        return(os.path.join(self.cache_dir, "{}.{}".format(table["id"], key)))
+
+    def query(self, syn, query):
+        if self.cache_dir is None:
+            return(syn.tableQuery(query).asDataFrame())
+        table_id = re.search(r"from\s+(syn\d+)", query, re.I).group(1)
+        path = self._path(query, syn.get(table_id, downloadFile = False))
+        for suffix, read in [(".parquet", pd.read_parquet), (".pkl", pd.read_pickle)]:
+            if os.path.exists(path + suffix):
+                return(read(path + suffix))
+        df = syn.tableQuery(query).asDataFrame()
+        os.makedirs(self.cache_dir, exist_ok = True)
+        try:
+            df.to_parquet(path + ".parquet.tmp")
+            os.replace(path + ".parquet.tmp", path + ".parquet")
+        except Exception: # no Parquet engine, or types Parquet can't hold
+            if os.path.exists(path + ".parquet.tmp"):
+                os.remove(path + ".parquet.tmp")
+            df.to_pickle(path + ".pkl.tmp")
+            os.replace(path + ".pkl.tmp", path + ".pkl")
+        return(df)
@@ -0,0 +1,51 @@
+import json
+import os
+from checkpoint import Journal
+
+
+def manifest_key(syn_file):
+    file_handle = syn_file.get("_file_handle") or {}
+    return "{}.{}.{}".format(syn_file["id"], syn_file.get("versionNumber"),
+                             file_handle.get("contentMd5"))
+
+
+def _to_builtin(value):
+    return(value.item() if hasattr(value, "item") else value)
+
+
+class ScanManifest(object):
+    # on-disk record of the summary computed for each version of a sensor file,
+    # so unchanged files never have to be downloaded or parsed again. Entries
+    # are journaled as they are put, so a crashed scan keeps its progress.
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        self._journal = Journal(path + ".journal")
+        self.entries.update(self._journal.entries)
+        self._dirty = bool(self._journal.entries)
+
+    def get(self, key):
+        return(self.entries.get(key))
+
+    def put(self, key, entry):
+        self.entries[key] = {k: _to_builtin(v) for k, v in entry.items()}
+        self._journal.put(key, self.entries[key])
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self._journal.clear()
+        self._dirty = False
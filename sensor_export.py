@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from instrumentation import file_size, report, timed_call
+
+
+PARTITION_COLS = ["subject_id", "device", "device_position", "participant_day"]
+EXPORT_CHUNKSIZE = 100000 # rows per Parquet row group
+UNKNOWN_POSITION = "Unknown"
+
+
+def partition_path(root, record):
+    return(os.path.join(root, *["{}={}".format(c, record[c]) for c in PARTITION_COLS]))
+
+
+def convert_sensor_file(path, out_path, chunksize = EXPORT_CHUNKSIZE):
+    # TSV -> Parquet with int64 millisecond timestamps and float32 sensor
+    # columns, one row group per chunk so each carries its own timestamp
+    # min/max statistics for filtering
+    tmp_path = out_path + ".tmp"
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_table(path, chunksize = chunksize):
+            timestamps = np.round(chunk.pop("timestamp").values * 1000)
+            chunk = chunk.astype(np.float32)
+            chunk.insert(0, "timestamp", timestamps.astype(np.int64))
+            table = pa.Table.from_pandas(chunk, preserve_index = False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, out_path)
+    return(rows)
+
+
+def export_sensor_files(syn, raw_data, root, workers = 1, chunksize = EXPORT_CHUNKSIZE,
+                        download_cache = None):
+    # raw_data is the output of curate_raw_data. Files already exported are
+    # skipped, so an interrupted export can simply be run again. With a
+    # DownloadCache, files are fetched through it and released as soon as
+    # they are converted, and at most 2 * workers files are downloaded but
+    # not yet converted.
+    fetch = download_cache.get if download_cache is not None else syn.get
+    pool = ProcessPoolExecutor(
+            max_workers = workers, mp_context = multiprocessing.get_context(
+                "forkserver")) if workers > 1 else None
+    converting = {}
+    rows = 0
+
+    def finish(timed, path):
+        converted, seconds, peak = timed
+        if download_cache is not None:
+            download_cache.release(path)
+        report("export_sensor_file", seconds, file_size(path), converted, peak)
+        return(converted)
+
+    try:
+        for _, record in raw_data.iterrows():
+            record = record.to_dict()
+            if pd.isnull(record.get("device_position")):
+                record["device_position"] = UNKNOWN_POSITION
+            directory = partition_path(root, record)
+            out_path = os.path.join(directory, "{}.parquet".format(record["source_file"]))
+            if os.path.exists(out_path):
+                continue
+            os.makedirs(directory, exist_ok = True)
+            syn_file = fetch(record["source_file"])
+            if pool is None:
+                rows += finish(timed_call(convert_sensor_file, syn_file.path,
+                                          out_path, chunksize), syn_file.path)
+                continue
+            converting[pool.submit(timed_call, convert_sensor_file, syn_file.path,
+                                   out_path, chunksize)] = syn_file.path
+            if len(converting) >= 2 * workers:
+                done, _ = wait(list(converting), return_when = FIRST_COMPLETED)
+                for future in done:
+                    rows += finish(future.result(), converting.pop(future))
+        for future in list(converting):
+            rows += finish(future.result(), converting.pop(future))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return(rows)
+
+
+def read_window(root, subject_id, timestamp_start, timestamp_end, device = None,
+                device_position = None, columns = None):
+    # samples in [timestamp_start, timestamp_end) seconds. Only the subject's
+    # (and device's and position's, when given) partition directory is
+    # listed, so the cost doesn't grow with the rest of the export, and the
+    # timestamp filter skips row groups by their statistics, so only the
+    # overlapping row groups are read.
+    directory = root
+    for c, value in zip(PARTITION_COLS, [subject_id, device, device_position]):
+        if value is None:
+            break
+        directory = os.path.join(directory, "{}={}".format(c, value))
+    paths = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(directory)
+             for name in names if name.endswith(".parquet")]
+    if not paths:
+        return(pd.DataFrame(columns = columns if columns is not None else ["timestamp"]))
+    dataset = ds.dataset(paths, format = "parquet", partitioning = "hive",
+                         partition_base_dir = root)
+    condition = (ds.field("subject_id") == subject_id) & \
+            (ds.field("timestamp") >= int(np.floor(timestamp_start * 1000))) & \
+            (ds.field("timestamp") < int(np.ceil(timestamp_end * 1000)))
+    if device is not None:
+        condition = condition & (ds.field("device") == device)
+    if device_position is not None:
+        condition = condition & (ds.field("device_position") == device_position)
+    df = dataset.to_table(columns = columns, filter = condition).to_pandas()
+    return(df.sort_values("timestamp").reset_index(drop = True)
+           if "timestamp" in df else df)
@@ -0,0 +1,225 @@
+import io
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from collections import deque
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, wait,
+                                FIRST_COMPLETED)
+from instrumentation import file_size, report, timed_call
+from scan_manifest import manifest_key
+
+
+SCAN_CHUNKSIZE = 1000000
+GAP_SECONDS = 1.0
+PREFETCH = 4
+FETCHERS = 2
+SUMMARY_COLS = ["sample_count", "sampling_rate", "gap_count"]
+AXIS_STATS = ["mean", "std"]
+
+
+def _read_first_lines(f, n = 2):
+    f.seek(0)
+    return([f.readline() for _ in range(n)])
+
+
+def _read_last_line(f, block_size = 65536):
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    tail = b""
+    while position > 0:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        tail = f.read(step) + tail
+        stripped = tail.rstrip(b"\r\n")
+        if b"\n" in stripped:
+            return(stripped.rsplit(b"\n", 1)[1] + b"\n")
+    return(tail.rstrip(b"\r\n") + b"\n")
+
+
+def _scan_sorted_timestamps(path):
+    # only the header, first and last rows are read
+    with open(path, "rb") as f:
+        header, first = _read_first_lines(f)
+        last = _read_last_line(f)
+    if not first.strip():
+        return(None, None)
+    df = pd.read_table(io.BytesIO(header + first + last), usecols = ["timestamp"])
+    return(df.timestamp.iloc[0], df.timestamp.iloc[-1])
+
+
+def scan_timestamps(path, is_sorted = False, chunksize = SCAN_CHUNKSIZE):
+    if is_sorted:
+        return(_scan_sorted_timestamps(path))
+    timestamp_start, timestamp_end = None, None
+    chunks = pd.read_table(path, usecols = ["timestamp"], chunksize = chunksize)
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        chunk_start = chunk.timestamp.min()
+        chunk_end = chunk.timestamp.max()
+        if timestamp_start is None or chunk_start < timestamp_start:
+            timestamp_start = chunk_start
+        if timestamp_end is None or chunk_end > timestamp_end:
+            timestamp_end = chunk_end
+    return(timestamp_start, timestamp_end)
+
+
+def _combine_moments(a, b):
+    # (count, mean, sum of squared deviations) of two chunks, see Chan et al.
+    n = a[0] + b[0]
+    if n == 0:
+        return(a)
+    delta = b[1] - a[1]
+    return(n, a[1] + delta * b[0] / n, a[2] + b[2] + delta ** 2 * a[0] * b[0] / n)
+
+
+def is_summary_column(c):
+    return(c in SUMMARY_COLS or c.rsplit("_", 1)[-1] in AXIS_STATS)
+
+
+def summary_columns(scans):
+    # SUMMARY_COLS followed by the mean/std of every axis found in scans, in
+    # order of first appearance
+    columns = list(SUMMARY_COLS)
+    for scan in scans:
+        columns += [c for c in scan if is_summary_column(c) and c not in columns]
+    return(columns)
+
+
+def summarize_sensor_file(path, chunksize = SCAN_CHUNKSIZE, gap_seconds = GAP_SECONDS):
+    # timestamp range, sample count, effective sampling rate, number of
+    # gaps longer than gap_seconds and per-axis mean/std in one chunked pass.
+    # Every numeric column besides timestamp is an axis, text columns such as
+    # labels or flags are skipped.
+    timestamp_start, timestamp_end, last = None, None, None
+    sample_count, gap_count = 0, 0
+    columns = list(pd.read_table(path, nrows = 0).columns)
+    if "timestamp" not in columns:
+        raise ValueError("{} has no timestamp column".format(path))
+    axes = [c for c in columns if c != "timestamp"]
+    moments = {axis: (0, 0.0, 0.0) for axis in axes}
+    chunks = pd.read_table(path, chunksize = chunksize)
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if not is_numeric_dtype(chunk["timestamp"]):
+            raise ValueError("The timestamp column of {} is not numeric".format(path))
+        # a column that is text anywhere in the file isn't an axis
+        for axis in [a for a in axes if not is_numeric_dtype(chunk[a])]:
+            axes.remove(axis)
+            del moments[axis]
+        timestamps = chunk.timestamp.values
+        if last is not None:
+            timestamps = np.concatenate([[last], timestamps])
+        gap_count += int((np.diff(timestamps) > gap_seconds).sum())
+        last = timestamps[-1]
+        sample_count += len(chunk)
+        chunk_start, chunk_end = chunk.timestamp.min(), chunk.timestamp.max()
+        if timestamp_start is None or chunk_start < timestamp_start:
+            timestamp_start = chunk_start
+        if timestamp_end is None or chunk_end > timestamp_end:
+            timestamp_end = chunk_end
+        for axis in axes:
+            values = chunk[axis].values.astype(np.float64)
+            values = values[~np.isnan(values)]
+            if len(values):
+                mean = values.mean()
+                moments[axis] = _combine_moments(
+                        moments[axis], (len(values), mean, ((values - mean) ** 2).sum()))
+    summary = {"timestamp_start": timestamp_start, "timestamp_end": timestamp_end,
+               "sample_count": sample_count, "gap_count": gap_count,
+               "sampling_rate": np.nan}
+    if sample_count > 1 and timestamp_end > timestamp_start:
+        summary["sampling_rate"] = (sample_count - 1) / (timestamp_end - timestamp_start)
+    for axis, (n, mean, m2) in moments.items():
+        summary["{}_{}".format(axis, AXIS_STATS[0])] = mean if n else np.nan
+        summary["{}_{}".format(axis, AXIS_STATS[1])] = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+    return(summary)
+
+
+def _scan_file(path, timestamps_sorted, summarize):
+    if summarize:
+        return(summarize_sensor_file(path))
+    timestamp_start, timestamp_end = scan_timestamps(path, is_sorted = timestamps_sorted)
+    return({"timestamp_start": timestamp_start, "timestamp_end": timestamp_end})
+
+
+def scan_sensor_files(syn, files, workers = 1, timestamps_sorted = False,
+                      manifest = None, summarize = True, prefetch = PREFETCH,
+                      fetchers = FETCHERS, download_cache = None):
+    # files is a list of (file_id, participant_day), results are returned as
+    # dicts holding dataFileHandleId, timestamp_start, timestamp_end and, when
+    # summarize is set, the SUMMARY_COLS and axis mean/std, in the same order. Summarizing
+    # needs a full pass, so timestamps_sorted only helps without it.
+    # Files whose current version is already in the manifest are not downloaded.
+    # Downloads run on `fetchers` threads while earlier files are parsed, in
+    # `workers` processes or inline. Besides the files being parsed, at most
+    # `prefetch` files are downloading or downloaded and waiting for a parser.
+    # With a DownloadCache, files are fetched through it and released as
+    # soon as they are summarized, so they can be evicted.
+    required = ["timestamp_start", "timestamp_end"] + (SUMMARY_COLS if summarize else [])
+    results = [None] * len(files)
+    pending = deque()
+    for index, (file_id, participant_day) in enumerate(files):
+        key = None
+        if manifest is not None:
+            key = manifest_key(syn.get(file_id, downloadFile = False))
+            entry = manifest.get(key)
+            if entry is not None and all(c in entry for c in required):
+                results[index] = entry
+                continue
+        pending.append((index, file_id, key, {"participant_day": participant_day}))
+
+    def finish(index, key, entry, timed, path):
+        scan, seconds, peak = timed
+        report("parse_sensor_file", seconds, file_size(path),
+               scan.get("sample_count", 0), peak)
+        if download_cache is not None:
+            download_cache.release(path)
+        entry.update(scan)
+        if manifest is not None:
+            manifest.put(key, entry)
+        results[index] = entry
+
+    fetch = download_cache.get if download_cache is not None else syn.get
+    fetch_pool = ThreadPoolExecutor(max_workers = fetchers)
+    # forkserver workers don't inherit the fetch threads or their locks
+    parse_pool = ProcessPoolExecutor(
+            max_workers = workers, mp_context = multiprocessing.get_context(
+                "forkserver")) if workers > 1 else None
+    window = max(prefetch, 1) + (workers if parse_pool is not None else 0)
+    fetching = {}
+    parsing = {}
+    try:
+        while pending or fetching or parsing:
+            while pending and len(fetching) + len(parsing) < window:
+                index, file_id, key, entry = pending.popleft()
+                fetching[fetch_pool.submit(fetch, file_id)] = (index, key, entry)
+            done, _ = wait(list(fetching) + list(parsing), return_when = FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    index, key, entry, path = parsing.pop(future)
+                    finish(index, key, entry, future.result(), path)
+                    continue
+                index, key, entry = fetching.pop(future)
+                syn_file = future.result()
+                entry["dataFileHandleId"] = syn_file['dataFileHandleId']
+                if parse_pool is not None:
+                    parsing[parse_pool.submit(timed_call, _scan_file, syn_file.path,
+                                              timestamps_sorted, summarize)] = \
+                            (index, key, entry, syn_file.path)
+                else:
+                    finish(index, key, entry,
+                           timed_call(_scan_file, syn_file.path, timestamps_sorted,
+                                      summarize),
+                           syn_file.path)
+    finally:
+        fetch_pool.shutdown()
+        if parse_pool is not None:
+            parse_pool.shutdown()
+        if manifest is not None:
+            manifest.save()
+    return(results)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import synapseclient as sc
+from pandas.api.types import is_float_dtype, is_numeric_dtype
+from table_upload import FLOAT_FORMAT
+
+
+DIFF_CHUNK_ROWS = 50000
+
+
+def _normalize(current, existing, columns):
+    # puts both sides in the same representation before hashing: a column
+    # that is numeric on either side is compared as float64, anything else
+    # as text with missing values as "". Float columns are compared as
+    # TableUploader writes them, at FLOAT_FORMAT precision, since that is
+    # all the existing table holds.
+    normalized = []
+    for df in (current, existing):
+        out = {}
+        for c in columns:
+            if is_numeric_dtype(current[c]) or is_numeric_dtype(existing[c]):
+                out[c] = pd.to_numeric(df[c], errors = "coerce").astype("float64").values
+                if is_float_dtype(current[c]) or is_float_dtype(existing[c]):
+                    out[c] = np.char.mod(FLOAT_FORMAT, out[c])
+            else:
+                out[c] = df[c].where(df[c].notnull(), "").astype(str).values
+        normalized.append(pd.DataFrame(out, columns = columns))
+    return(normalized)
+
+
+def _hash(df, columns):
+    return(pd.util.hash_pandas_object(df[columns], index = False).values)
+
+
+def diff_rows(current, existing, key_cols):
+    # -> (inserts, updates, deletes). Rows are matched on key_cols, with
+    # repeats of a key matched in order of appearance. inserts are rows of
+    # current, updates are rows of current indexed like the existing rows
+    # they replace and deletes are rows of existing.
+    columns = list(current.columns)
+    cur, old = _normalize(current, existing, columns)
+    for df in (cur, old):
+        df["_row"] = _hash(df, columns)
+        df["_key"] = _hash(df, key_cols)
+        df["_occurrence"] = df.groupby("_key", sort = False).cumcount()
+        df["_key"] = _hash(df, ["_key", "_occurrence"])
+    cur["_position"] = np.arange(len(cur))
+    old["_position"] = np.arange(len(old))
+    merged = cur[["_key", "_row", "_position"]].merge(
+            old[["_key", "_row", "_position"]], on = "_key", how = "outer",
+            suffixes = ("_current", "_existing"), indicator = True)
+    inserted = merged[merged["_merge"] == "left_only"]
+    deleted = merged[merged["_merge"] == "right_only"]
+    changed = merged[(merged["_merge"] == "both") &
+                     (merged["_row_current"] != merged["_row_existing"])]
+    inserts = current.iloc[
+            inserted["_position_current"].astype(int).values].reset_index(drop = True)
+    updates = current.iloc[changed["_position_current"].astype(int).values].copy()
+    updates.index = existing.index[changed["_position_existing"].astype(int).values]
+    deletes = existing.iloc[deleted["_position_existing"].astype(int).values]
+    return(inserts, updates, deletes)
+
+
+def store_incremental(syn, schema, df, key_cols, chunk_rows = DIFF_CHUNK_ROWS):
+    # Brings an existing table in line with df by sending only the rows that
+    # changed. Returns the (inserts, updates, deletes) row counts, or None
+    # when the table doesn't exist yet and has to be stored in full. The
+    # existing table must have the same columns as df.
+    table_id = syn.findEntityId(schema["name"], schema["parentId"])
+    if table_id is None:
+        return(None)
+    existing = syn.tableQuery("select * from {}".format(table_id)).asDataFrame()
+    if sorted(existing.columns) != sorted(df.columns):
+        raise ValueError("Columns of {} ({}) don't match the curated table, store it "
+                         "in full instead".format(schema["name"], table_id))
+    inserts, updates, deletes = diff_rows(df, existing[list(df.columns)], key_cols)
+    if len(deletes):
+        # the query's ROW_ID_ROW_VERSION index tells Synapse which rows to drop
+        syn.delete(sc.Table(table_id, deletes))
+    for changes in (updates, inserts):
+        for i in range(0, len(changes), chunk_rows):
+            syn.store(sc.Table(table_id, changes.iloc[i:i + chunk_rows]))
+    return(len(inserts), len(updates), len(deletes))
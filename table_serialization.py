@@ -0,0 +1,18 @@
+import pandas as pd
+
+
+INTEGER_TYPES = ["INTEGER"]
+
+
+def serialize_columns(df, columns):
+    # Converts the INTEGER columns of a table schema (a list of sc.Column)
+    # to the nullable Int64 dtype in one vectorized step per column, so
+    # 3.0 is written as 3 and NaN, None, "" or any other text that isn't a
+    # number as an empty (NULL) cell.
+    # The frame is copied shallowly, only the converted columns are new.
+    df = df.copy(deep = False)
+    for column in columns:
+        name = column["name"]
+        if column["columnType"] in INTEGER_TYPES and name in df:
+            df[name] = pd.to_numeric(df[name], errors = "coerce").astype("Int64")
+    return(df)
@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import pandas as pd
+import synapseclient as sc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+UPLOAD_CHUNK_ROWS = 50000
+FLOAT_FORMAT = "%.12g"
+STATE_FILE = "state.json"
+
+
+def fingerprint(df):
+    # cheap content hash so a resumed upload can tell it is spooling the same rows
+    return("{}.{}".format(len(df), int(pd.util.hash_pandas_object(
+        df, index = False).sum() % 2 ** 63)))
+
+
+class TableUploader(object):
+    # Uploads tables in row chunks spooled to spool_dir. Chunks of all tables
+    # share one pool of `workers` threads, so independent tables upload in
+    # parallel with bounded concurrency. Committed chunks are recorded in
+    # spool_dir/state.json and skipped when an interrupted upload is rerun
+    # with the same data. The spool is removed once every table is stored.
+
+    def __init__(self, syn, spool_dir = None, chunk_rows = UPLOAD_CHUNK_ROWS,
+                 workers = 4):
+        self.syn = syn
+        self.spool_dir = spool_dir
+        self.chunk_rows = chunk_rows
+        self.workers = workers
+        self.state = {}
+        self._lock = threading.Lock()
+
+    def _state_path(self):
+        return(os.path.join(self.spool_dir, STATE_FILE))
+
+    def _load_state(self):
+        if os.path.exists(self._state_path()):
+            with open(self._state_path()) as f:
+                self.state = json.load(f)
+
+    def _save_state(self):
+        tmp_path = self._state_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self._state_path())
+
+    def _spool(self, schema, df):
+        # -> [(chunk index, path)] of the chunks not yet committed
+        name = schema["name"]
+        table_state = self.state.get(name)
+        digest = fingerprint(df)
+        if table_state is not None and table_state["fingerprint"] != digest:
+            raise RuntimeError(
+                "{} has changed since its upload was interrupted, remove {} "
+                "to upload it from scratch".format(name, self.spool_dir))
+        if table_state is None:
+            table_state = self.state[name] = {
+                "fingerprint": digest, "committed": [],
+                "chunks": max((len(df) - 1) // self.chunk_rows + 1, 1)}
+        directory = os.path.join(self.spool_dir, name.replace(" ", "_"))
+        os.makedirs(directory, exist_ok = True)
+        chunks = []
+        for i in range(table_state["chunks"]):
+            if i in table_state["committed"]:
+                continue
+            path = os.path.join(directory, "chunk-{:05d}.csv".format(i))
+            if not os.path.exists(path):
+                chunk = df.iloc[i * self.chunk_rows:(i + 1) * self.chunk_rows]
+                chunk.to_csv(path + ".tmp", index = False, float_format = FLOAT_FORMAT,
+                             quotechar = '"', escapechar = "\\")
+                os.replace(path + ".tmp", path)
+            chunks.append((i, path))
+        return(chunks)
+
+    def _upload_chunk(self, schema, name, i, path):
+        self.syn.store(sc.Table(schema, path))
+        with self._lock:
+            self.state[name]["committed"].append(i)
+            self._save_state()
+        os.remove(path)
+
+    def upload(self, tables):
+        # tables is a list of (sc.Schema, DataFrame)
+        temporary = self.spool_dir is None
+        if temporary:
+            self.spool_dir = tempfile.mkdtemp(prefix = "table_upload_")
+        os.makedirs(self.spool_dir, exist_ok = True)
+        self._load_state()
+        try:
+            work = []
+            for schema, df in tables:
+                schema = self.syn.store(schema)
+                for i, path in self._spool(schema, df):
+                    work.append((schema, schema["name"], i, path))
+            self._save_state()
+            error = None
+            with ThreadPoolExecutor(max_workers = self.workers) as pool:
+                futures = [pool.submit(self._upload_chunk, *w) for w in work]
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        error = future.exception()
+            if error is not None:
+                raise error
+            shutil.rmtree(self.spool_dir)
+        finally:
+            if temporary:
+                shutil.rmtree(self.spool_dir, ignore_errors = True)
+                self.spool_dir = None
@@ -0,0 +1,195 @@
+import io
+import mmap
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from interval_index import SensorIntervalIndex
+
+
+TASK_COLS = ["subject_id", "visit", "session", "task_id", "task_code",
+             "timestamp_start", "timestamp_end"]
+HOME_TASK_COLS = ["subject_id", "timestamp_start", "timestamp_end"]
+SEGMENT_KEY_COLS = ["device", "device_position"]
+OPEN_FILES = 8
+
+
+class SortedSensorFile(object):
+    # Memory-mapped TSV whose rows are in timestamp order. A window is found
+    # by binary search over byte offsets, reading one line per probe, and
+    # only the rows inside it are parsed.
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ) \
+                if os.path.getsize(path) else b""
+        self.data_start = self._map.find(b"\n") + 1
+        self.header = self._map[:self.data_start]
+        self.timestamp_col = self.header.decode().rstrip("\r\n").split("\t").index(
+                "timestamp")
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _line_containing(self, offset, lo):
+        return(self._map.rfind(b"\n", lo, offset) + 1 or lo)
+
+    def _next_line(self, line_start):
+        newline = self._map.find(b"\n", line_start)
+        return(len(self._map) if newline == -1 else newline + 1)
+
+    def _timestamp_at(self, line_start):
+        line = self._map[line_start:self._next_line(line_start)].strip()
+        if not line: # trailing blank line
+            return(np.inf)
+        return(float(line.split(b"\t")[self.timestamp_col]))
+
+    def offset(self, timestamp):
+        # byte offset of the first row with a timestamp >= timestamp. Every
+        # line starting before lo is earlier than timestamp, the line at hi
+        # (or the end of the file) is not.
+        lo, hi = self.data_start, len(self._map)
+        while lo < hi:
+            mid = self._line_containing((lo + hi) // 2, lo)
+            if self._timestamp_at(mid) < timestamp:
+                lo = self._next_line(mid)
+            else:
+                hi = mid
+        return(lo)
+
+    def read_window(self, timestamp_start, timestamp_end):
+        start = self.offset(timestamp_start)
+        end = self.offset(np.nextafter(timestamp_end, np.inf))
+        return(pd.read_table(io.BytesIO(self.header + self._map[start:end])))
+
+
+class _OpenFiles(object):
+    # keeps the most recently used sensor files mapped
+
+    def __init__(self, syn, size = OPEN_FILES):
+        self.syn = syn
+        self.size = size
+        self._files = OrderedDict()
+
+    def get(self, source_file):
+        if source_file in self._files:
+            self._files.move_to_end(source_file)
+        else:
+            self._files[source_file] = SortedSensorFile(self.syn.get(source_file).path)
+            if len(self._files) > self.size:
+                self._files.popitem(last = False)[1].close()
+        return(self._files[source_file])
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+def task_windows(scores):
+    # one row per task. The clinic scores from curate_scores are long
+    # format (one row per phenotype and body region), home scores already
+    # have one row per window.
+    cols = TASK_COLS if all(c in scores for c in TASK_COLS) else HOME_TASK_COLS
+    cols = cols + [c for c in scores.columns if c.startswith("seconds_since")]
+    return(scores[cols].drop_duplicates().reset_index(drop = True))
+
+
+def iter_segments(syn, raw_data, scores, export_dir = None):
+    # yields (task, segment) for every task and every device/position
+    # recording during it. task is a dict of the task columns plus device
+    # and device_position, segment holds the samples inside the task window,
+    # stitched together when the task spans two files. With export_dir the
+    # Parquet dataset from sensor_export is read instead of the TSVs.
+    tasks = task_windows(scores)
+    task_cols = list(tasks.columns)
+    # group on a row number rather than the task columns, which can be NaN
+    tasks["_task"] = np.arange(len(tasks))
+    index = SensorIntervalIndex(raw_data)
+    matches = index.join(tasks)
+    if len(matches) == 0:
+        return
+    matches["device_position"] = matches["device_position"].fillna("")
+    open_files = _OpenFiles(syn) if export_dir is None else None
+    try:
+        for _, group in matches.groupby(["_task"] + SEGMENT_KEY_COLS, sort = False):
+            first = group.iloc[0]
+            task = {c: first[c] for c in task_cols + SEGMENT_KEY_COLS}
+            if export_dir is not None:
+                from sensor_export import read_window # needs pyarrow
+                segment = read_window(
+                        export_dir, task["subject_id"], task["timestamp_start"],
+                        np.nextafter(task["timestamp_end"], np.inf),
+                        device = task["device"],
+                        device_position = task["device_position"] or None)
+                segment["timestamp"] = segment["timestamp"] / 1000.0
+            else:
+                segment = pd.concat(
+                        [open_files.get(source_file).read_window(
+                            task["timestamp_start"], task["timestamp_end"])
+                         for source_file in group["source_file"]],
+                        ignore_index = True)
+                segment = segment.sort_values("timestamp", kind = "mergesort")
+            yield(task, segment.reset_index(drop = True))
+    finally:
+        if open_files is not None:
+            open_files.close()
+
+
+def write_segment_batches(segments, out_dir, batch_size = 256):
+    # Writes segments to out_dir/batch-<n>.npz. Each batch holds every
+    # sample of its segments in one float32 "values" array, "timestamps",
+    # "offsets" so segment i is values[offsets[i]:offsets[i + 1]], the sensor
+    # "columns" and one array per task column. The columns are every numeric
+    # sensor column found in the batch, in order of first appearance, with
+    # NaN values for segments from files that lack one. Returns the number
+    # of batches.
+    os.makedirs(out_dir, exist_ok = True)
+    batch = []
+    batches = 0
+    for task, segment in segments:
+        batch.append((task, segment))
+        if len(batch) == batch_size:
+            _write_batch(batch, os.path.join(out_dir, "batch-{:05d}.npz".format(batches)))
+            batches += 1
+            batch = []
+    if batch:
+        _write_batch(batch, os.path.join(out_dir, "batch-{:05d}.npz".format(batches)))
+        batches += 1
+    return(batches)
+
+
+def _write_batch(batch, path):
+    columns = []
+    for _, segment in batch:
+        columns += [c for c in segment.columns if c != "timestamp" and c not in columns
+                    and is_numeric_dtype(segment[c])]
+    lengths = [len(segment) for _, segment in batch]
+    arrays = {
+        "values": np.concatenate([segment.reindex(columns = columns).values
+                                  for _, segment in batch]).astype(np.float32),
+        "timestamps": np.concatenate([segment["timestamp"].values
+                                      for _, segment in batch]).astype(np.float64),
+        "offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        "columns": np.array(columns)}
+    tasks = pd.DataFrame([task for task, _ in batch])
+    for c in tasks.columns:
+        arrays["task_" + c] = tasks[c].values.astype(
+                str if tasks[c].dtype == object else tasks[c].dtype)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_batch(path):
+    # -> (tasks DataFrame, list of per-segment sample arrays, columns)
+    with np.load(path) as batch:
+        offsets = batch["offsets"]
+        values = batch["values"]
+        tasks = pd.DataFrame({k[len("task_"):]: batch[k] for k in batch.files
+                              if k.startswith("task_")})
+        segments = [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return(tasks, segments, list(batch["columns"]))
@@ -0,0 +1,71 @@
+import openpyxl
+from pandas.io.parsers import TextParser
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters.strip().upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return(index - 1)
+
+
+def _usecols_indices(usecols):
+    # Excel-style column ranges such as "B" or "A:B,D" -> [1] or [0, 1, 3]
+    indices = []
+    for part in usecols.split(","):
+        if ":" in part:
+            first, last = part.split(":")
+            indices.extend(range(_column_index(first), _column_index(last) + 1))
+        else:
+            indices.append(_column_index(part))
+    return(indices)
+
+
+def _convert_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return(int(value))
+    return(value)
+
+
+class Workbook(object):
+    # opens an xlsx file once in read-only mode and decodes each sheet at most
+    # once, then serves read_excel style slices of it from memory
+
+    def __init__(self, path):
+        self.path = path
+        self._book = openpyxl.load_workbook(path, read_only = True, data_only = True)
+        self._sheets = {}
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._book.close()
+
+    def _sheet_rows(self, sheet_name):
+        if sheet_name not in self._sheets:
+            sheet = self._book[sheet_name]
+            # read-only sheets trust the stored <dimension>, which can be
+            # stale, so as read_excel does, read up to the last cell instead
+            sheet.reset_dimensions()
+            rows = [[_convert_cell(v) for v in row]
+                    for row in sheet.iter_rows(values_only = True)]
+            width = max(len(r) for r in rows) if rows else 0
+            rows = [r + [""] * (width - len(r)) for r in rows]
+            while rows and all(v == "" for v in rows[-1]):
+                rows.pop()
+            self._sheets[sheet_name] = rows
+        return(self._sheets[sheet_name])
+
+    def read_sheet(self, sheet_name, header = 0, skiprows = None, usecols = None,
+                   skipfooter = 0, squeeze = False, na_values = None):
+        parser = TextParser(
+                self._sheet_rows(sheet_name), header = header, skiprows = skiprows,
+                usecols = _usecols_indices(usecols) if usecols else None,
+                skipfooter = skipfooter, squeeze = squeeze, na_values = na_values)
+        return(parser.read())